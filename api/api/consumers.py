@@ -3,86 +3,254 @@ from __future__ import annotations
 import asyncio
 import logging
 from asyncio import Future
-from collections import defaultdict
-from typing import Dict, Optional, List
+from collections import defaultdict, deque
+from itertools import islice
+from typing import Dict, Optional, List, Deque, NamedTuple, Set, Tuple
+from uuid import uuid4
 
+from django.conf import settings
 from django.db.models import Model
+from django.utils import timezone
 from pydantic import ValidationError
 from starlette.websockets import WebSocket, WebSocketDisconnect, WebSocketState
 
+from api.events.bus import EventBus
 from api.events.event import EventOut, AbsEvent
 from api.models import Player, AuthSession
 
 
-class Subscription:
+class Subscription(NamedTuple):
+    """ Topic of model events: one row of a model, or every row if model_id is None """
 
-    def __init__(self, model: str, model_id: dict):
-        self.model = model
-        self.model_id = id
+    model: str
+    model_id: Optional[int] = None
+
+    @classmethod
+    def of(cls, model_name: str, model_id: Optional[int] = None) -> Subscription:
+        # names of models in events are lowercase class names, like "ingameteam"
+        return cls(model_name.replace("_", "").lower(), model_id)
+
+
+class ReplayBuffer:
+    """
+        Last model events sent by this worker, numbered in order they were sent.
+        Client that reconnects tells number of the last event it has seen and gets only events it missed.
+        Numbers are only meaningful within one process, so each one starts its own stream.
+    """
+
+    def __init__(self, size: int):
+        self.stream_id = uuid4().hex
+        self.seq = 0
+        self.events: Deque[Tuple[EventOut, Subscription]] = deque(maxlen=size)
+
+    def add(self, evt: EventOut, sub: Subscription):
+        self.seq += 1
+        evt.stream = self.stream_id
+        evt.seq = self.seq
+        self.events.append((evt, sub))
+
+    def since(self, stream_id: str, seq: int) -> Optional[List[Tuple[EventOut, Subscription]]]:
+        """ Events sent after `seq`, None if some of them are already forgotten """
+
+        if stream_id != self.stream_id or seq > self.seq:
+            return None
+
+        if seq == self.seq:
+            return []
+
+        first = self.events[0][0].seq if self.events else self.seq + 1
+
+        if first > seq + 1:
+            return None
+
+        return list(islice(self.events, seq + 1 - first, None))
+
+
+class ConnInfo:
+    """ What is known about a websocket connection """
+
+    def __init__(self):
+        self.connected_at = timezone.now()
+        self.session_id: Optional[int] = None
+        self.player_id: Optional[int] = None
 
 
 class WsPool:
     """ Stores every websocket consumer instance associated with session. """
 
-    # associate user ID with websocket connection wrapper
+    # associate session ID with websocket connection wrapper
     _session_registry: Dict[int, WsConn] = {}
 
-    # store all connections
-    _connections: List[WsConn] = []
+    # every open connection of a player, player can have several tabs open
+    _player_registry: Dict[int, Set[WsConn]] = defaultdict(set)
+
+    # store all connections, authorized or not
+    _connections: Dict[WsConn, ConnInfo] = {}
 
-    # store bukkit connection separately
-    _bukkit: Optional[WsConn] = None
+    # connections interested in events of a model row or of a whole model
+    _subscribers: Dict[Subscription, Set[WsConn]] = defaultdict(set)
+
+    # store connections of bukkit servers separately, by server id
+    _bukkit_servers: Dict[int, WsConn] = {}
 
     # tasks to do when bukkit server comes online
     _on_connect_handlers = defaultdict(list)
 
+    # number of connections closed because they couldn't keep up with their events
+    _evicted = 0
+
+    # recent model events, replayed to clients that reconnect
+    _replay = ReplayBuffer(settings.WS_REPLAY_BUFFER_SIZE)
+
     @classmethod
-    def set_bukkit(cls, conn):
-        cls._bukkit = conn
+    def set_bukkit(cls, conn, server_id: int, capacity: int):
+        conn.server_id = server_id
+        conn.capacity = capacity
+        cls._bukkit_servers[server_id] = conn
+
+        cls.announce_bukkit(conn)
 
         # run handlers
-        for server_id, handlers in cls._on_connect_handlers.items():
-            for handler in handlers:
-                asyncio.create_task(handler())
+        for handler in cls._on_connect_handlers.get(server_id, []):
+            asyncio.create_task(handler())
+
+    @classmethod
+    def announce_bukkit(cls, conn: WsConn):
+        """ Let every worker know server can host games """
+
+        asyncio.create_task(EventBus.publish(EventBus.BUKKIT_SERVERS, {
+            "server_id": conn.server_id,
+            "capacity": conn.capacity,
+            "online": True,
+        }))
+
+    @classmethod
+    def announce_bukkit_servers(cls):
+        """ Announce every server connected to this worker again, so that other workers keep it listed """
+
+        for conn in cls._bukkit_servers.values():
+            cls.announce_bukkit(conn)
 
     @classmethod
-    def get_bukkit_server(cls, server_id=None) -> WsConn:
-        return cls._bukkit
+    def get_bukkit_server(cls, server_id=None) -> Optional[WsConn]:
+        if server_id is None:
+            server_id = settings.BUKKIT_DEFAULT_SERVER
+
+        return cls._bukkit_servers.get(server_id)
 
     @classmethod
-    def authorize_connection(cls, session, conn):
+    def authorize_connection(cls, session: AuthSession, conn: WsConn):
+        info = cls._connections.get(conn)
+
+        if info is None:
+            return
+
+        # connection can switch session, for example on login
+        cls._forget_session(conn, info)
+
+        conn.session = session
+        info.session_id = session.id
+        info.player_id = session.player_id
+
         cls._session_registry[session.id] = conn
 
+        if session.player_id is not None:
+            cls._player_registry[session.player_id].add(conn)
+
+    @classmethod
+    def _forget_session(cls, conn: WsConn, info: ConnInfo):
+        conns = cls._player_registry.get(info.player_id)
+
+        if conns is not None:
+            conns.discard(conn)
+
+            if not conns:
+                del cls._player_registry[info.player_id]
+
+        if cls._session_registry.get(info.session_id) is conn:
+            del cls._session_registry[info.session_id]
+
+            # another tab with the same session is still open
+            for other in conns or ():
+                if cls._connections[other].session_id == info.session_id:
+                    cls._session_registry[info.session_id] = other
+                    break
+
+        info.session_id = info.player_id = None
+
     @classmethod
     def register_connection(cls, conn):
-        cls._connections.append(conn)
+        cls._connections[conn] = ConnInfo()
 
     @classmethod
     def disconnect(cls, conn: WsConn):
         """ Once websocket disconnected, we forget it ever existed """
-        if cls._bukkit == conn:
-            cls._bukkit = None
+        conn.close_queue()
 
-        for k, v in cls._session_registry.items():
-            if v == conn:
-                break
-        else:
-            return
+        for sub in list(conn.subscriptions):
+            cls.unsubscribe(conn, sub)
+
+        if conn.is_bukkit and cls._bukkit_servers.get(conn.server_id) is conn:
+            del cls._bukkit_servers[conn.server_id]
+
+            asyncio.create_task(EventBus.publish(EventBus.BUKKIT_SERVERS, {
+                "server_id": conn.server_id,
+                "online": False,
+            }))
+
+        info = cls._connections.pop(conn, None)
 
-        cls._connections.remove(conn)
-        del cls._session_registry[k]
+        if info is not None:
+            cls._forget_session(conn, info)
 
     @classmethod
-    async def model_event(cls, event: str, instance: Model):
-        """ Send events to listeners on frontend """
+    def subscribe(cls, conn: WsConn, sub: Subscription):
+        cls._subscribers[sub].add(conn)
+        conn.subscriptions.add(sub)
+
+    @classmethod
+    def unsubscribe(cls, conn: WsConn, sub: Subscription):
+        conns = cls._subscribers.get(sub)
+
+        if conns is not None:
+            conns.discard(conn)
+
+            if not conns:
+                del cls._subscribers[sub]
+
+        conn.subscriptions.discard(sub)
+
+    @classmethod
+    def get_subscribers(cls, model_name: str, model_id: Optional[int]) -> Set[WsConn]:
+        return cls._subscribers.get(Subscription(model_name, model_id), set()) | \
+            cls._subscribers.get(Subscription(model_name), set())
+
+    @classmethod
+    def evict(cls, conn: WsConn):
+        """ Close connection of a client that doesn't read its events """
+        cls._evicted += 1
+        cls.disconnect(conn)
+
+        # 1013: try again later
+        asyncio.create_task(conn.websocket.close(code=1013))
+
+    @classmethod
+    async def model_event(cls, event: str, instance: Model, fields: dict = None):
+        """ Send events to listeners on frontend, connected to this or any other worker """
 
         evt = None
 
         if event == "update":
-            evt = EventOut(type=EventOut.Type.MODEL_UPDATE, payload={
+            payload = {
                 "model_name": type(instance).__name__.lower(),
                 "model_pk": instance.id,
-            })
+            }
+
+            # delta of changed fields, if it is known
+            if fields:
+                payload["fields"] = fields
+
+            evt = EventOut(type=EventOut.Type.MODEL_UPDATE, payload=payload)
 
         if event == "create":
             evt = EventOut(type=EventOut.Type.MODEL_CREATE, payload={
@@ -90,26 +258,74 @@ class WsPool:
                 "model_pk": instance.id,
             })
 
-        if not event:
+        if not evt:
             return
 
-        WsPool.broadcast_event(evt)
+        await EventBus.publish(EventBus.MODEL_EVENTS, {"event": evt.dict()})
 
     @classmethod
     def broadcast_event(cls, evt: EventOut):
 
         print(f"broadcast to {len(cls._connections)}")
-        for conn in cls._connections:
+        for conn in list(cls._connections):
 
             # remove disconnected clients
-            if conn.websocket.client_state == 3:
-                cls._connections.remove(conn)
+            if conn.closed or conn.websocket.client_state == WebSocketState.DISCONNECTED:
+                cls.disconnect(conn)
                 continue
 
-            asyncio.create_task(conn.send_event(evt))
+            conn.enqueue(evt)
+
+    @classmethod
+    def publish_event(cls, evt: EventOut, model_name: str, model_id: Optional[int]):
+        """ Send model event to connections subscribed to it. Bukkit receives every model event """
+
+        cls._replay.add(evt, Subscription(model_name, model_id))
+
+        for conn in cls.get_subscribers(model_name, model_id):
+            conn.enqueue(evt)
 
-        if cls._bukkit:
-            asyncio.create_task(cls._bukkit.send_event(evt))
+        for bukkit in cls._bukkit_servers.values():
+            bukkit.enqueue(evt)
+
+    @classmethod
+    def resume(cls, conn: WsConn, stream_id: str, seq: int):
+        """ Send reconnected client events of its subscriptions that it missed """
+
+        events = cls._replay.since(stream_id, seq)
+
+        if events is None:
+            conn.enqueue(cls.resync_event())
+            return
+
+        for evt, sub in events:
+            if conn.is_subscribed(sub):
+                conn.enqueue(evt)
+
+    @classmethod
+    def resync_event(cls) -> EventOut:
+        """ Tell client to load everything again, and where event stream continues from """
+
+        return EventOut(
+            type=EventOut.Type.RESYNC,
+            payload={"stream": cls._replay.stream_id, "seq": cls._replay.seq},
+        )
+
+    @classmethod
+    def get_queue_metrics(cls) -> dict:
+        """ Summary of send queues of every connection """
+
+        metrics = [conn.get_queue_metrics() for conn in cls._connections]
+
+        return {
+            "connections": len(metrics),
+            "queued": sum(m["depth"] for m in metrics),
+            "max_depth": max((m["max_depth"] for m in metrics), default=0),
+            "dropped": sum(m["dropped"] for m in metrics),
+            "coalesced": sum(m["coalesced"] for m in metrics),
+            "evicted": cls._evicted,
+            "subscriptions": len(cls._subscribers),
+        }
 
     @classmethod
     def on_bukkit_connect(cls, server_id):
@@ -122,11 +338,27 @@ class WsPool:
     def get_conn(cls, session_id) -> Optional[WsConn]:
         return cls._session_registry.get(session_id)
 
+    @classmethod
+    def get_player_conns(cls, player_id: int) -> Set[WsConn]:
+        return cls._player_registry.get(player_id, set())
+
     @classmethod
     def get_player_conn(cls, player: Player) -> Optional[WsConn]:
-        for sess_id, conn in cls._session_registry.items():
-            if AuthSession.objects.get(id=sess_id).player == player:
-                return conn
+        return next(iter(cls.get_player_conns(player.id)), None)
+
+    @classmethod
+    def is_online(cls, player_id: int) -> bool:
+        return player_id in cls._player_registry
+
+    @classmethod
+    def get_info(cls, conn: WsConn) -> Optional[ConnInfo]:
+        return cls._connections.get(conn)
+
+
+@EventBus.on(EventBus.MODEL_EVENTS)
+def deliver_model_event(message: dict):
+    evt = EventOut.from_dict(message["event"])
+    WsPool.publish_event(evt, evt.payload["model_name"], evt.payload["model_pk"])
 
 
 class WsConn:
@@ -137,14 +369,35 @@ class WsConn:
         self.websocket = websocket
         self.session = None
         self.is_bukkit = False
+        self.server_id: Optional[int] = None
+        self.capacity: Optional[int] = None
         self.awaiting_response = {}
-        self.subscriptions: List[Subscription] = []
+        self.subscriptions: Set[Subscription] = set()
+
+        # events waiting to be written to socket, drained by a single writer task
+        self.send_queue: Deque[EventOut] = deque()
+        self.queue_size = settings.WS_SEND_QUEUE_SIZE
+        self.overflow = settings.WS_SEND_QUEUE_OVERFLOW
+        self.closed = False
+
+        self.max_depth = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+        self._has_events = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_events())
 
         # register connection, no matter if it's authorized or not
         WsPool.register_connection(self)
 
     def subscribe(self, sub: Subscription):
-        self.subscriptions.append(sub)
+        WsPool.subscribe(self, sub)
+
+    def unsubscribe(self, sub: Subscription):
+        WsPool.unsubscribe(self, sub)
+
+    def is_subscribed(self, sub: Subscription) -> bool:
+        return sub in self.subscriptions or Subscription(sub.model) in self.subscriptions
 
     async def run(self):
         """ Keep reading and dispatching events """
@@ -170,14 +423,130 @@ class WsConn:
             coro = WsEventManager.propagate_abstract_event(event, self)
             asyncio.create_task(coro)
 
-    async def send_event(self, event: EventOut) -> Optional[Dict]:
+    def enqueue(self, event: EventOut) -> bool:
+        """ Queue event without waiting for it to be sent. Returns False if event was not queued """
+
+        if self.closed:
+            return False
+
+        # commands for bukkit and events someone waits for are never dropped
+        if len(self.send_queue) >= self.queue_size and not self.is_bukkit and not event.needs_confirm:
+
+            if self.overflow == "coalesce" and self._coalesce(event):
+                return True
+
+            if self.overflow == "disconnect":
+                logging.warning(f"Send queue of {self.websocket.client} is full, disconnecting")
+                WsPool.evict(self)
+                return False
+
+            # client is told to load everything again instead of getting what is queued
+            self._drop_queued()
+            event = WsPool.resync_event()
+
+        self.send_queue.append(event)
+        self.max_depth = max(self.max_depth, len(self.send_queue))
+        self._has_events.set()
+        return True
+
+    def _coalesce(self, event: EventOut) -> bool:
+        """ Merge model update into update of the same row that is still queued """
+
+        if event.type != EventOut.Type.MODEL_UPDATE:
+            return False
+
+        key = (event.payload["model_name"], event.payload["model_pk"])
+
+        for i, queued in enumerate(self.send_queue):
+            if queued.type != EventOut.Type.MODEL_UPDATE or queued.needs_confirm:
+                continue
+
+            if (queued.payload["model_name"], queued.payload["model_pk"]) != key:
+                continue
+
+            payload = {"model_name": key[0], "model_pk": key[1]}
+
+            # delta is only valid if both updates carry one, otherwise client has to refetch
+            if "fields" in queued.payload and "fields" in event.payload:
+                payload["fields"] = {**queued.payload["fields"], **event.payload["fields"]}
+
+            merged = EventOut(type=event.type, payload=payload)
+            merged.stream, merged.seq = event.stream, event.seq
+
+            self.send_queue[i] = merged
+            self.coalesced += 1
+            return True
+
+        return False
+
+    def _drop_queued(self):
+        """ Forget queued events that nobody waits for """
+
+        kept = deque(event for event in self.send_queue if event.needs_confirm)
+
+        self.dropped += len(self.send_queue) - len(kept)
+        self.send_queue = kept
+
+    async def _write_events(self):
+        """ The only coroutine that writes to socket, sends queued events in order """
+
+        while True:
+            while not self.send_queue:
+                self._has_events.clear()
+                await self._has_events.wait()
+
+            event = self.send_queue.popleft()
+
+            try:
+                await self.websocket.send_text(event.encode())
+            except (WebSocketDisconnect, RuntimeError):
+                return WsPool.disconnect(self)
+
+    def close_queue(self):
+        """ Stop writer and release everything that waits for this connection """
+        self.closed = True
+        self._writer.cancel()
+        self.send_queue.clear()
+
+        for future in self.awaiting_response.values():
+            if not future.done():
+                future.set_result(None)
+
+        self.awaiting_response.clear()
+
+    def get_queue_metrics(self) -> dict:
+        return {
+            "depth": len(self.send_queue),
+            "max_depth": self.max_depth,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+    async def send_event(self, event: EventOut, timeout: float = None) -> Optional[Dict]:
+        """
+            Send event. Events that need confirmation are waited for at most `timeout` seconds,
+            their response payload is returned, or None if it wasn't confirmed in time.
+        """
 
         if self.websocket.client_state == WebSocketState.DISCONNECTED:
             WsPool.disconnect(self)
             return
 
+        if not event.needs_confirm:
+            self.enqueue(event)
+            return
+
+        timeout = timeout or settings.WS_RESPONSE_TIMEOUT
         response = Future()
         self.awaiting_response[event.message_id] = response
 
-        await self.websocket.send_json(event.dict())
-        return await response
+        if not self.enqueue(event):
+            self.awaiting_response.pop(event.message_id, None)
+            return
+
+        try:
+            return await asyncio.wait_for(response, timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"{event} was not confirmed in {timeout} seconds")
+        finally:
+            self.awaiting_response.pop(event.message_id, None)
@@ -1,14 +1,19 @@
+import contextlib
 import inspect
 import traceback
-from typing import Optional, Type, List, Any, Callable
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Optional, Type, List, Any, Callable, Dict, Tuple, Iterable
 from uuid import UUID
 
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.sessions.models import Session
 from fastapi import Request, HTTPException, Depends, params, Query, Response
+from pydantic import BaseModel
 from pydantic.class_validators import root_validator
 from pydantic.main import create_model
 from django.db.models import Model
+from django.db.models.signals import post_save, post_delete
 
 from api.exceptions import AuthorizationError
 from api.models import Team, Player, AuthSession, Event, Match, Game, Invite, InGameTeam, MapPick, PlayerQueue, Map
@@ -248,6 +253,83 @@ def complex_field_factory(
     return dynamic_model
 
 
+# rows loaded ahead of validation, by (model, primary field) and value of that field
+_prefetched: ContextVar[Optional[Dict[Tuple[Type[Model], str], Dict[Any, Model]]]] = ContextVar(
+    "prefetched_models", default=None
+)
+
+
+def get_model_fields(schema: Type[BaseModel]):
+    """ Fields of schema that are looked up by DatabaseModelField """
+
+    return {
+        name: field.type_ for name, field in schema.__fields__.items()
+        if getattr(field.type_, 'model', None) is not None
+    }
+
+
+def forget_prefetched(sender, instance, signal, **kwargs):
+    """
+        Row was saved or deleted while prefetched rows are in use. Unless it was saved
+        through the prefetched instance itself, that instance is stale and is looked up again.
+        Deleted row is forgotten either way.
+    """
+
+    prefetched = _prefetched.get()
+
+    if prefetched is None:
+        return
+
+    for (model, primary_field), rows in prefetched.items():
+        if model is not sender:
+            continue
+
+        for key, row in list(rows.items()):
+            if row.pk == instance.pk and (row is not instance or signal is post_delete):
+                del rows[key]
+
+
+post_save.connect(forget_prefetched, weak=False)
+post_delete.connect(forget_prefetched, weak=False)
+
+
+@contextlib.contextmanager
+def prefetch_models(items: Iterable[Tuple[Type[BaseModel], dict]]):
+    """
+        Load every row referenced by DatabaseModelField of given (schema, payload) pairs
+        with one query per model. Schemas validated inside this block take rows from here,
+        so the same row is also shared between all payloads that reference it.
+        Row saved through another instance is dropped, see `forget_prefetched`.
+    """
+
+    values = defaultdict(set)
+
+    for schema, payload in items:
+        for name, field in get_model_fields(schema).items():
+            # fields identified by several columns are looked up one by one
+            if field.model_fields or payload.get(name) is None:
+                continue
+
+            try:
+                values[(field.model, field.primary_field)].add(field.normalize(payload[name]))
+            except (TypeError, ValueError):
+                continue
+
+    rows = {}
+
+    for (model, primary_field), keys in values.items():
+        rows[(model, primary_field)] = {
+            getattr(instance, primary_field): instance
+            for instance in model.objects.filter(**{f"{primary_field}__in": keys})
+        }
+
+    token = _prefetched.set(rows)
+    try:
+        yield rows
+    finally:
+        _prefetched.reset(token)
+
+
 def DatabaseModelField( # NOQA
         model: Type[Model],
         primary_field: str = 'uuid',
@@ -279,6 +361,13 @@ def DatabaseModelField( # NOQA
 
     class DatabaseModelFieldInfo:
 
+        @classmethod
+        def normalize(cls, v):
+            if not isinstance(v, type):
+                v = type(v)
+
+            return normalizer(v)
+
         @classmethod
         def __get_validators__(cls):
             yield cls.validate
@@ -303,6 +392,14 @@ def DatabaseModelField( # NOQA
 
             v = normalizer(v)
 
+            prefetched = _prefetched.get()
+
+            if prefetched is not None and not model_fields and (model, primary_field) in prefetched:
+                instance = prefetched[(model, primary_field)].get(v)
+
+                if instance is not None:
+                    return instance
+
             from django.db.models.query_utils import DeferredAttribute
 
             field = getattr(model, primary_field)
@@ -335,6 +432,10 @@ def DatabaseModelField( # NOQA
         def __repr__(self):
             return f'DatabaseModelFieldInfo({model.__name__})'
 
+    DatabaseModelFieldInfo.model = model
+    DatabaseModelFieldInfo.primary_field = primary_field
+    DatabaseModelFieldInfo.model_fields = model_fields
+
     return DatabaseModelFieldInfo
 
 
@@ -42,9 +42,11 @@ async def on_game_create_request(minestrike: MineStrike, event: CreateGameIntent
             f"Unknown map {event.mapName}"
         )
 
+    # player asked server they are on, so game is hosted there
     game = await create_game(
         map=map,
         mode=mode,
+        server_id=minestrike.server_id,
     )
 
     # update server object effectively updating list of games
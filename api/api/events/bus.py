@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, Set, Callable, List, AsyncIterator, Optional
+from uuid import uuid4
+
+from django.conf import settings
+
+from api.events.event import encode_json
+
+
+class MemoryBackend:
+    """ Delivers messages inside this process. Enough for a single worker and for tests """
+
+    def __init__(self):
+        self._queues: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        self._queues.clear()
+
+    async def publish(self, channel: str, message: str):
+        for queue in self._queues[channel]:
+            queue.put_nowait(message)
+
+    async def listen(self, channel: str) -> AsyncIterator[str]:
+        queue = asyncio.Queue()
+        self._queues[channel].add(queue)
+
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues[channel].discard(queue)
+
+
+class BroadcasterBackend:
+    """ Delivers messages to every worker through redis, postgres or kafka, see `broadcaster` package """
+
+    def __init__(self, url: str):
+        from broadcaster import Broadcast
+
+        self.broadcast = Broadcast(url)
+
+    async def connect(self):
+        await self.broadcast.connect()
+
+    async def disconnect(self):
+        await self.broadcast.disconnect()
+
+    async def publish(self, channel: str, message: str):
+        await self.broadcast.publish(channel=channel, message=message)
+
+    async def listen(self, channel: str) -> AsyncIterator[str]:
+        async with self.broadcast.subscribe(channel=channel) as subscriber:
+            async for event in subscriber:
+                yield event.message
+
+
+def get_backend(url: str):
+    if url.startswith("memory://"):
+        return MemoryBackend()
+
+    return BroadcasterBackend(url)
+
+
+class EventBus:
+    """
+        Pub/sub between API workers. Each worker serves only its own websocket clients,
+        so model events and bukkit commands are published here and every worker
+        handles them for connections it owns.
+    """
+
+    # model events for websocket clients
+    MODEL_EVENTS = "model-events"
+
+    # changes that make in-memory caches of other workers stale
+    MODEL_CHANGES = "model-changes"
+
+    # bukkit servers that came online or went offline
+    BUKKIT_SERVERS = "bukkit-servers"
+
+    # commands for bukkit server, run by the worker bukkit is connected to
+    BUKKIT_COMMANDS = "bukkit-commands"
+
+    RESPONSES = "responses"
+
+    worker_id = uuid4().hex
+
+    _backend = None
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _handlers: Dict[str, List[Callable]] = defaultdict(list)
+    _tasks: List[asyncio.Task] = []
+    _requests: Dict[str, asyncio.Future] = {}
+
+    @classmethod
+    def on(cls, channel: str):
+        def inner(func):
+            cls._handlers[channel].append(func)
+            return func
+        return inner
+
+    @classmethod
+    def is_distributed(cls) -> bool:
+        """ Whether messages can come from other workers """
+        return cls._backend is not None and not isinstance(cls._backend, MemoryBackend)
+
+    @classmethod
+    async def start(cls, url: str = None):
+        cls._backend = get_backend(url or settings.WS_PUBSUB_URL)
+        cls._loop = asyncio.get_running_loop()
+        await cls._backend.connect()
+
+        for channel in [*cls._handlers, cls.RESPONSES]:
+            cls._tasks.append(asyncio.create_task(cls._listen(channel)))
+
+        # let listeners subscribe before anything is published
+        await asyncio.sleep(0)
+
+    @classmethod
+    async def stop(cls):
+        for task in cls._tasks:
+            task.cancel()
+
+        cls._tasks = []
+
+        if cls._backend is not None:
+            await cls._backend.disconnect()
+            cls._backend = None
+
+    @classmethod
+    async def publish(cls, channel: str, message: dict):
+        message = {**message, "worker_id": cls.worker_id}
+
+        # bus is not started in scripts and management commands, handle message right here
+        if cls._backend is None:
+            return await cls._handle(channel, message)
+
+        await cls._backend.publish(channel, encode_json(message))
+
+    @classmethod
+    def publish_threadsafe(cls, channel: str, message: dict):
+        """ Publish from any thread, sync routes and their commit hooks run in threadpool """
+        asyncio.run_coroutine_threadsafe(cls.publish(channel, message), cls._loop)
+
+    @classmethod
+    async def request(cls, channel: str, message: dict, timeout: float) -> Optional[dict]:
+        """ Publish message and wait for some worker to respond to it """
+
+        request_id = uuid4().hex
+        response = asyncio.get_event_loop().create_future()
+        cls._requests[request_id] = response
+
+        try:
+            await cls.publish(channel, {**message, "request_id": request_id})
+            return await asyncio.wait_for(response, timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Nobody responded to {channel} request in {timeout} seconds")
+        finally:
+            cls._requests.pop(request_id, None)
+
+    @classmethod
+    async def respond(cls, request: dict, payload: Optional[dict]):
+        await cls.publish(cls.RESPONSES, {"request_id": request["request_id"], "payload": payload})
+
+    @classmethod
+    async def _listen(cls, channel: str):
+        async for message in cls._backend.listen(channel):
+            try:
+                message = json.loads(message)
+            except ValueError:
+                logging.exception(f"Malformed {channel} message: {message!r}")
+                continue
+
+            await cls._handle(channel, message)
+
+    @classmethod
+    async def _handle(cls, channel: str, message: dict):
+        if channel == cls.RESPONSES:
+            response = cls._requests.get(message["request_id"])
+
+            if response is not None and not response.done():
+                response.set_result(message["payload"])
+            return
+
+        for handler in cls._handlers[channel]:
+            try:
+                result = handler(message)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception:
+                logging.exception(f"Error while handling {channel} message")
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, Tuple, Type, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Model
+
+
+class PendingEvent:
+    """ Model event of one row that waits to be sent """
+
+    def __init__(self, event: str, instance: Model, fields: Optional[dict]):
+        self.event = event
+        self.instance = instance
+        self.fields = fields
+
+    def merge(self, event: str, instance: Model, fields: Optional[dict]):
+        """ Fold later event of the same row into this one """
+
+        self.instance = instance
+
+        if event == "delete" or self.event == "delete":
+            self.event = event
+            self.fields = None
+            return
+
+        # row created in this window is sent as created, client loads it whole anyway
+        if self.event == "create":
+            return
+
+        # delta is only valid if both updates carry one, otherwise client has to refetch
+        if self.fields is not None and fields is not None:
+            self.fields = {**self.fields, **fields}
+        else:
+            self.fields = None
+
+
+class ModelEventDebouncer:
+    """
+        Stage between model signals and websocket clients.
+        Events are held until transaction they were made in is committed, so clients never
+        fetch data that can be rolled back. Then they are collected for WS_EVENT_DEBOUNCE seconds
+        and every changed row is sent once, no matter how many times it was saved.
+        Sync routes run in threadpool, so events can come from any thread.
+    """
+
+    _pending: Dict[Tuple[Type[Model], int], PendingEvent] = {}
+    _flush_scheduled = False
+    _lock = threading.Lock()
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def start(cls):
+        """ Remember loop of the app, flushes are scheduled on it from every thread """
+        cls._loop = asyncio.get_running_loop()
+
+    @classmethod
+    def add(cls, event: str, instance: Model, fields: dict = None):
+        transaction.on_commit(lambda: cls._collect(event, instance, fields))
+
+    @classmethod
+    def _collect(cls, event: str, instance: Model, fields: Optional[dict]):
+        key = (type(instance), instance.pk)
+
+        with cls._lock:
+            pending = cls._pending.get(key)
+
+            if pending is None:
+                cls._pending[key] = PendingEvent(event, instance, fields)
+            else:
+                pending.merge(event, instance, fields)
+
+            # window starts with first event, so rows that keep changing are still sent regularly
+            if not cls._flush_scheduled:
+                cls._schedule_flush()
+
+    @classmethod
+    def _schedule_flush(cls):
+        try:
+            loop = cls._loop or asyncio.get_event_loop()
+            loop.call_soon_threadsafe(loop.call_later, settings.WS_EVENT_DEBOUNCE, cls.flush)
+        except RuntimeError:
+            # events stay pending and go out with flush scheduled by next event
+            logging.exception("Can't schedule model events flush, no event loop")
+            return
+
+        cls._flush_scheduled = True
+
+    @classmethod
+    def flush(cls):
+        from api.consumers import WsPool
+
+        with cls._lock:
+            pending, cls._pending = cls._pending, {}
+            cls._flush_scheduled = False
+
+        for evt in pending.values():
+            asyncio.create_task(WsPool.model_event(event=evt.event, instance=evt.instance, fields=evt.fields))
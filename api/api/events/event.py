@@ -1,19 +1,40 @@
+import json
 import random
+from typing import Optional
 
 from pydantic import BaseModel
 
+try:
+    # optional, several times faster than standard json
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_json(data) -> str:
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+
+    return json.dumps(data, separators=(",", ":"))
+
 
 class EventOut:
     """ Event that will be sent via websocket to frontend. Usually represents change in the database """
 
-    def __init__(self, type, payload=None, message=None, status=200, session_key=None):
+    def __init__(self, type, payload=None, message=None, status=200, session_key=None, delivery=None):
         self.type = type
         self.payload = payload
         self.message = message
         self.status = status
         self.session_key = session_key
+        self.delivery = delivery or EventOut.Delivery.NOTIFY
         self.message_id = random.randint(0, 1_000_000)
 
+        # position in stream of model events, see ReplayBuffer
+        self.stream = None
+        self.seq = None
+        self._encoded = None
+
     def dict(self):
         return {
             'type': self.type,
@@ -21,12 +42,55 @@ class EventOut:
             'message': self.message,
             'status': self.status,
             'session_key': self.session_key,
-            'message_id': self.message_id
+            'message_id': self.message_id,
+            'delivery': self.delivery,
+            'stream': self.stream,
+            'seq': self.seq,
         }
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "EventOut":
+        """ Restore event that was sent between workers """
+
+        event = cls(
+            type=data['type'],
+            payload=data['payload'],
+            message=data['message'],
+            status=data['status'],
+            session_key=data['session_key'],
+            delivery=data['delivery'],
+        )
+        event.message_id = data['message_id']
+        return event
+
+    def encode(self) -> str:
+        """ JSON of event, computed once no matter how many sockets it is sent to """
+
+        if self._encoded is None:
+            self._encoded = encode_json(self.dict())
+
+        return self._encoded
+
+    def clear_encoded(self):
+        """ Forget JSON computed by `encode`, call after payload is changed """
+        self._encoded = None
+
+    @property
+    def needs_confirm(self) -> bool:
+        return self.delivery == EventOut.Delivery.CONFIRM
+
     def __str__(self):
         return f"EventOut[{self.status}]<{self.type}>"
 
+    class Delivery:
+        """ Whether receiver has to answer event with ConfirmEvent """
+
+        # notification, sent without waiting for anything
+        NOTIFY = "notify"
+
+        # request, sender waits for confirmation with response payload
+        CONFIRM = "confirm"
+
     class Type:
         """ Event types to send. Websocket should ideally be used only to send events.
         Everything else should be done via HTTP. """
@@ -35,6 +99,12 @@ class EventOut:
         MODEL_UPDATE = "ModelUpdateEvent"
         MODEL_CREATE = "ModelCreateEvent"
 
+        # several commands for bukkit, confirmed together
+        BATCH = "CommandBatchEvent"
+
+        # missed events can't be replayed, client has to load everything again
+        RESYNC = "ResyncEvent"
+
 
 class AbsEvent(BaseModel):
     """
@@ -46,6 +116,7 @@ class AbsEvent(BaseModel):
 
     name: str  # Event name, corresponds to bukkit event name
     payload: dict  # All the fields for that event
+    server_id: Optional[int]  # Bukkit server that sent event
 
 
 class EventResponse(BaseModel):
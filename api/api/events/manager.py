@@ -2,10 +2,11 @@ import asyncio
 import functools
 import traceback
 from collections import defaultdict
-from typing import Type, Any
+from typing import Type, Any, List, Callable
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
+from api.dependencies import prefetch_models
 from api.events.event import AbsEvent, IntentResponse
 from api.events.schemas.bukkit import IntentEvent
 
@@ -29,6 +30,7 @@ class EventManager:
 
     def __init__(self):
         self.handlers = defaultdict(list)
+        self.schemas = {}
         self.waiters = []
 
     def _execute_waiters(self, event, model, waiter_type):
@@ -72,11 +74,13 @@ class EventManager:
             if isinstance(event, str):
                 self.handlers[event].append(func)
             else:
+                self.schemas[event.__name__] = event
                 self.handlers[event.__name__].append(
                     lambda sender, evt_payload:
                     func(
                         sender,
-                        event.parse_obj(evt_payload)
+                        # payload of batched event is parsed already
+                        evt_payload if isinstance(evt_payload, event) else event.parse_obj(evt_payload)
                     )
                 )
 
@@ -89,9 +93,10 @@ class EventManager:
         abs_event = AbsEvent(name=type(event).__name__, payload=event.dict())
         return await self.propagate_abstract_event(abs_event, sender)
 
-    async def propagate_abstract_event(self, event: AbsEvent, entity):
+    async def propagate_abstract_event(self, event: AbsEvent, entity, parsed: BaseModel = None):
         """
-            Propagate generic event with strict schema
+            Propagate generic event with strict schema.
+            If payload was already parsed into that schema, it can be given as `parsed`.
         """
 
         print(f"Propagate event {event.name}")
@@ -103,7 +108,7 @@ class EventManager:
 
         for handler in self.handlers[event.name]:
             try:
-                response = handler(entity, event.payload)
+                response = handler(entity, event.payload if parsed is None else parsed)
                 if asyncio.iscoroutine(response):
                     response = await response
             except Exception:
@@ -113,6 +118,34 @@ class EventManager:
 
         return response
 
+    async def propagate_abstract_events(self, events: List[AbsEvent], get_entity: Callable[[AbsEvent], Any]):
+        """
+            Propagate events one by one in given order. Models referenced by all events
+            are loaded beforehand with one query per model, rows saved by an event are
+            looked up again by events after it. Returns result of every event,
+            event that does not match its schema is reported and not propagated.
+        """
+
+        schemas = [(self.schemas.get(event.name), event.payload) for event in events]
+
+        results = []
+
+        with prefetch_models([(schema, payload) for schema, payload in schemas if schema is not None]):
+            for event, (schema, payload) in zip(events, schemas):
+                parsed = None
+
+                if schema is not None:
+                    try:
+                        parsed = schema.parse_obj(payload)
+                    except ValidationError as e:
+                        results.append({"error": str(e)})
+                        continue
+
+                response = await self.propagate_abstract_event(event, get_entity(event), parsed)
+                results.append({"payload": response})
+
+        return results
+
     def wait(self, event: Type[BaseModel], timeout=None) -> WaitObject:
 
         async def fail_task_if_did_not_succeed(future: asyncio.Future):
@@ -1,16 +1,66 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, Any, List, Tuple
 
 from pydantic import BaseModel
 
 
 class BukkitInitEvent(BaseModel):
     secret: str
+    server_id: int = 1
+
+    # number of games server can host at once
+    capacity: Optional[int]
 
 
 class PingEvent(BaseModel):
     ping_id: int
 
 
+class SubscribeEvent(BaseModel):
+    """
+        Ask to receive events of a model row, or of every row if model_pk is not set.
+        Instead of a model, id of a view can be given, like {"player_id": 1, "game_id": 2},
+        then events of every model the view is built from are received.
+    """
+
+    model_name: Optional[str]
+    model_pk: Optional[int]
+    view_id: Optional[Dict[str, Any]]
+
+    def get_topics(self) -> List[Tuple[str, Optional[int]]]:
+        topics = []
+
+        if self.model_name:
+            topics.append((self.model_name, self.model_pk))
+
+        for key, value in (self.view_id or {}).items():
+            if key.endswith("_id") and isinstance(value, int):
+                topics.append((key[:-3], value))
+
+        return topics
+
+
+class UnsubscribeEvent(SubscribeEvent):
+    pass
+
+
+class AuthorizeEvent(BaseModel):
+    """ Associate connection with session, so that player is known to be online """
+
+    session_id: str
+
+
+class ResumeEvent(BaseModel):
+    """
+        Sent after reconnect with position of the last received model event.
+        Subscriptions are restored by the same event, so that no event is
+        received both live and from replay.
+    """
+
+    stream: str
+    seq: int
+    subscriptions: List[SubscribeEvent] = []
+
+
 class ConfirmEvent(BaseModel):
     confirm_message_id: int
     payload: Optional[Dict]
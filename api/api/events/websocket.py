@@ -1,11 +1,15 @@
 import logging
 import traceback
 
-from api.consumers import WsConn, WsPool
+from django.conf import settings
+
+from api.consumers import WsConn, WsPool, Subscription
 from api.events.event import EventOut
 from api.events.manager import EventManager
-from api.events.schemas.websocket import BukkitInitEvent, PingEvent, ConfirmEvent
+from api.events.schemas.websocket import BukkitInitEvent, PingEvent, ConfirmEvent, SubscribeEvent, \
+    UnsubscribeEvent, ResumeEvent, AuthorizeEvent
 from api.exceptions import AuthorizationError
+from api.models import AuthSession
 
 WsEventManager = EventManager()
 
@@ -16,13 +20,15 @@ async def confirm(consumer: WsConn, event: ConfirmEvent):
     msg_id = event.confirm_message_id
 
     if msg_id not in consumer.awaiting_response:
-        logging.warning("")
+        # late confirmation, or confirmation of a notification
+        logging.debug(f"Message {msg_id} is not awaiting confirmation")
         return
 
     future = consumer.awaiting_response[msg_id]
     logging.info(f"Confirming message {msg_id} ({future})")
     try:
-        future.set_result(event.payload)
+        # None is left for events that were not confirmed
+        future.set_result(event.payload if event.payload is not None else {})
         consumer.awaiting_response.pop(msg_id)
     except Exception as e:
         traceback.print_exc()
@@ -40,6 +46,38 @@ async def confirm_ping(consumer: WsConn, event: PingEvent):
     await consumer.send_event(evt)
 
 
+@WsEventManager.on(SubscribeEvent)
+async def subscribe(consumer: WsConn, event: SubscribeEvent):
+    for model_name, model_pk in event.get_topics():
+        consumer.subscribe(Subscription.of(model_name, model_pk))
+
+
+@WsEventManager.on(UnsubscribeEvent)
+async def unsubscribe(consumer: WsConn, event: UnsubscribeEvent):
+    for model_name, model_pk in event.get_topics():
+        consumer.unsubscribe(Subscription.of(model_name, model_pk))
+
+
+@WsEventManager.on(AuthorizeEvent)
+async def authorize(consumer: WsConn, event: AuthorizeEvent):
+    session = AuthSession.objects.filter(session_key=event.session_id).first()
+
+    if session is None:
+        raise AuthorizationError
+
+    WsPool.authorize_connection(session, consumer)
+
+
+@WsEventManager.on(ResumeEvent)
+async def resume(consumer: WsConn, event: ResumeEvent):
+    # nothing is awaited until replay is queued, so live events can only come after it
+    for subscription in event.subscriptions:
+        for model_name, model_pk in subscription.get_topics():
+            consumer.subscribe(Subscription.of(model_name, model_pk))
+
+    WsPool.resume(consumer, event.stream, event.seq)
+
+
 @WsEventManager.on(BukkitInitEvent)
 async def init_bukkit(consumer: WsConn, event: BukkitInitEvent):
 
@@ -49,7 +87,7 @@ async def init_bukkit(consumer: WsConn, event: BukkitInitEvent):
 
     consumer.is_bukkit = True
 
-    WsPool.set_bukkit(consumer)
+    WsPool.set_bukkit(consumer, event.server_id, event.capacity or settings.BUKKIT_SERVER_CAPACITY)
 
     evt = EventOut(
         type="ACK_CONN",
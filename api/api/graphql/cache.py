@@ -0,0 +1,211 @@
+import contextlib
+import hashlib
+import json
+from collections import OrderedDict, defaultdict
+from contextvars import ContextVar
+from typing import Optional, Set, Tuple, Dict, Any
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+
+# (model label, pk) of a row, or (model label, None) for a whole table
+Tag = Tuple[str, Optional[Any]]
+
+
+class ReadSet:
+    """ Everything that was read from the database while a single response was resolved """
+
+    def __init__(self):
+        self.tags: Set[Tag] = set()
+
+        # set when response depends on something other than database
+        self.cacheable = True
+
+        # while set, queries are not recorded as table reads, rows are recorded explicitly
+        self.exact = False
+
+
+_reads: ContextVar[Optional[ReadSet]] = ContextVar("graphql_reads", default=None)
+
+
+@contextlib.contextmanager
+def track_reads():
+    """ Record every database read made inside this block and in tasks it starts """
+
+    _install_query_recorder(None, connection)
+
+    reads = ReadSet()
+    token = _reads.set(reads)
+    try:
+        yield reads
+    finally:
+        _reads.reset(token)
+
+
+@contextlib.contextmanager
+def exact_reads():
+    """ Queries inside this block look rows up by primary key, caller records rows it read """
+
+    reads = _reads.get()
+
+    if reads is None or reads.exact:
+        yield
+        return
+
+    reads.exact = True
+    try:
+        yield
+    finally:
+        reads.exact = False
+
+
+def record_read(model, pk=None):
+    reads = _reads.get()
+    if reads is not None:
+        reads.tags.add((model._meta.label, pk))
+
+
+def mark_uncacheable():
+    reads = _reads.get()
+    if reads is not None:
+        reads.cacheable = False
+
+
+_tables = None
+
+
+def _get_tables():
+    global _tables
+
+    if _tables is None:
+        _tables = [
+            (f'"{model._meta.db_table}"', model._meta.label)
+            for model in apps.get_models(include_auto_created=True)
+        ]
+
+    return _tables
+
+
+def _record_query(execute, sql, params, many, context):
+    reads = _reads.get()
+
+    if reads is not None and not reads.exact:
+        for table, label in _get_tables():
+            if table in sql:
+                reads.tags.add((label, None))
+
+    return execute(sql, params, many, context)
+
+
+def _install_query_recorder(sender, connection, **kwargs):
+    # wrappers are a stack that connection.execute_wrapper() pushes to and pops from,
+    # so recorder goes to the bottom of it to never get popped by someone else
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+connection_created.connect(_install_query_recorder)
+
+
+class ResponseCache:
+    """
+        Cache of GraphQL responses keyed by query, variables and viewer.
+
+        Every entry is tagged with rows and tables that were read while it was resolved,
+        and is dropped as soon as any of them changes.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+
+        self._entries: OrderedDict[str, Tuple[dict, Set[Tag]]] = OrderedDict()
+        self._keys_by_tag: Dict[Tag, Set[str]] = defaultdict(set)
+
+        # increased on every invalidation, responses resolved across it are not cached
+        self.version = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(query_key: str, variables: Optional[dict], operation_name: Optional[str], viewer_id) -> str:
+        raw = json.dumps([query_key, variables, operation_name, viewer_id], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: str, data: dict, tags: Set[Tag]):
+        self.discard(key)
+
+        self._entries[key] = (data, tags)
+        for tag in tags:
+            self._keys_by_tag[tag].add(key)
+
+        while len(self._entries) > self.max_size:
+            self.discard(next(iter(self._entries)))
+
+    def discard(self, key: str):
+        entry = self._entries.pop(key, None)
+
+        if entry is None:
+            return
+
+        for tag in entry[1]:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def invalidate(self, model, pk=None):
+        """ Drop responses that read given row, or any row of model if pk is None """
+
+        self.version += 1
+
+        label = model._meta.label
+
+        if pk is None:
+            tags = [tag for tag in self._keys_by_tag if tag[0] == label]
+        else:
+            tags = [(label, pk), (label, None)]
+
+        for tag in tags:
+            for key in list(self._keys_by_tag.get(tag, ())):
+                self.discard(key)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+response_cache = ResponseCache(settings.GRAPHQL_RESPONSE_CACHE_SIZE)
+
+
+def invalidate_on_commit(model, pk=None):
+    """
+        Invalidate responses now and once more after transaction is committed,
+        request that ran in between could have cached data from before the commit
+    """
+
+    response_cache.invalidate(model, pk)
+    transaction.on_commit(lambda: response_cache.invalidate(model, pk))
+
+
+def model_changed(instance, created=False):
+    """ Invalidate responses that depend on changed instance """
+
+    # new row changes result of every query that could have returned it
+    invalidate_on_commit(type(instance), None if created else instance.pk)
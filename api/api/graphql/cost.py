@@ -0,0 +1,157 @@
+from typing import Dict, Optional
+
+from graphql import DocumentNode, FieldNode, FragmentSpreadNode, InlineFragmentNode, OperationDefinitionNode, \
+    GraphQLSchema, GraphQLError, get_named_type, value_from_ast_untyped, ValidationRule
+
+# arguments that limit how many items a field returns
+PAGE_SIZE_ARGS = ("size", "count")
+
+# arguments that list items a field returns
+ITEM_LIST_ARGS = ("ids",)
+
+# page size used by paginated fields when client does not pass one
+DEFAULT_PAGE_SIZE = 10
+
+
+class QueryCostError(GraphQLError):
+    pass
+
+
+class QueryCostAnalyzer:
+    """
+        Estimates how expensive a query is before it gets executed.
+
+        Every field costs its weight plus the cost of its selection. Fields that
+        return several items (have `size` argument or list of `ids`) multiply both
+        by the number of items. Root fields cost 1 unless told otherwise,
+        other fields are free unless they declare weight, see @computed(cost=).
+    """
+
+    def __init__(self, schema: GraphQLSchema, weights: Dict[str, Dict[str, int]], max_cost: int):
+        self.schema = schema
+        self.weights = weights
+        self.max_cost = max_cost
+
+    def get_weight(self, type_name: str, field_name: str) -> int:
+        weight = self.weights.get(type_name, {}).get(field_name)
+
+        if weight is not None:
+            return weight
+
+        if self.schema.query_type and type_name == self.schema.query_type.name:
+            return 1
+
+        return 0
+
+    def measure(self, document: DocumentNode, variables: dict = None, operation_name: str = None) -> int:
+        operation = self.get_operation(document, operation_name)
+
+        if operation is None:
+            return 0
+
+        root_type = self.schema.get_root_type(operation.operation)
+        fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if not isinstance(definition, OperationDefinitionNode)
+        }
+
+        return self.measure_selection(operation.selection_set, root_type, fragments, variables or {})
+
+    def check(self, document: DocumentNode, variables: dict = None, operation_name: str = None) -> int:
+        """ Measure query cost and raise QueryCostError if it is over the budget """
+
+        cost = self.measure(document, variables, operation_name)
+
+        if cost > self.max_cost:
+            raise QueryCostError(
+                f"Query cost {cost} exceeds maximum of {self.max_cost}",
+                extensions={"cost": cost, "max_cost": self.max_cost},
+            )
+
+        return cost
+
+    def validation_rules(self, context_value, document: DocumentNode, data: dict):
+        """
+            Validation rules that reject documents over the budget, for handlers
+            that only accept validation rules, like websocket subscriptions
+        """
+
+        try:
+            self.check(document, data.get("variables"), data.get("operationName"))
+            return []
+        except QueryCostError as e:
+            error = e
+
+        class QueryCostRule(ValidationRule):
+            def enter_document(self, *args):
+                self.report_error(error)
+
+        return [QueryCostRule]
+
+    @staticmethod
+    def get_operation(document: DocumentNode, operation_name: Optional[str]) -> Optional[OperationDefinitionNode]:
+        operations = [d for d in document.definitions if isinstance(d, OperationDefinitionNode)]
+
+        if operation_name:
+            for operation in operations:
+                if operation.name and operation.name.value == operation_name:
+                    return operation
+            return None
+
+        return operations[0] if len(operations) == 1 else None
+
+    def measure_selection(self, selection_set, parent_type, fragments, variables) -> int:
+        if selection_set is None:
+            return 0
+
+        cost = 0
+
+        for selection in selection_set.selections:
+
+            if isinstance(selection, FieldNode):
+                cost += self.measure_field(selection, parent_type, fragments, variables)
+
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = fragments[selection.name.value]
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                cost += self.measure_selection(fragment.selection_set, fragment_type, fragments, variables)
+
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value)
+                cost += self.measure_selection(selection.selection_set, fragment_type, fragments, variables)
+
+        return cost
+
+    def measure_field(self, node: FieldNode, parent_type, fragments, variables) -> int:
+        name = node.name.value
+
+        if name.startswith("__"):
+            return 0
+
+        weight = self.get_weight(parent_type.name, name)
+
+        field = getattr(parent_type, "fields", {}).get(name)
+        children = 0
+
+        if field is not None and node.selection_set:
+            children = self.measure_selection(node.selection_set, get_named_type(field.type), fragments, variables)
+
+        return self.get_multiplier(node, field, variables) * (weight + children)
+
+    @staticmethod
+    def get_multiplier(node: FieldNode, field, variables) -> int:
+        args = {arg.name.value: value_from_ast_untyped(arg.value, variables) for arg in node.arguments or []}
+
+        for name in ITEM_LIST_ARGS:
+            if isinstance(args.get(name), list):
+                return max(len(args[name]), 1)
+
+        for name in PAGE_SIZE_ARGS:
+            if field is not None and name in field.args:
+                size = args.get(name)
+                return max(size if isinstance(size, int) else DEFAULT_PAGE_SIZE, 1)
+
+        return 1
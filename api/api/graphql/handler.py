@@ -0,0 +1,297 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from inspect import isawaitable
+from typing import Any, Optional, Tuple, List
+
+from ariadne.asgi.handlers import GraphQLHTTPHandler, GraphQLWSHandler
+from ariadne.extensions import ExtensionManager
+from ariadne.graphql import parse_query, validate_query, handle_graphql_errors, handle_query_result, \
+    validate_variables, validate_operation_name
+from ariadne.types import GraphQLResult
+from graphql import GraphQLError, DocumentNode, execute, ExecutionContext, OperationType, get_operation_ast
+
+from api.graphql.cache import ResponseCache, track_reads
+from api.graphql.cost import QueryCostAnalyzer
+from api.graphql.virtual import get_context_viewer
+
+
+class DocumentCache:
+    """ LRU cache of parsed documents and their validation errors, keyed by sha256 of query text """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._documents: OrderedDict[str, Tuple[DocumentNode, Optional[List[GraphQLError]]]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        entry = self._documents.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._documents.move_to_end(key)
+        return entry
+
+    def put(self, key: str, document: DocumentNode, errors: Optional[List[GraphQLError]]):
+        self._documents[key] = (document, errors)
+        self._documents.move_to_end(key)
+
+        while len(self._documents) > self.max_size:
+            self._documents.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._documents
+
+    def __len__(self):
+        return len(self._documents)
+
+
+def hash_query(query: str) -> str:
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class CachedGraphQLHTTPHandler(GraphQLHTTPHandler):
+    """
+        GraphQL HTTP handler that parses and validates every distinct query only once.
+
+        With persisted queries enabled client may send only the sha256 hash of a query
+        it sent before (Apollo `persistedQuery` extension). Unknown hashes are answered
+        with PersistedQueryNotFound, so client can retry with full query text.
+
+        Parse and validation time is reported in `extensions.timing` of every response.
+
+        If cost analyzer is given, queries over its budget are rejected before
+        execution, and cost of every query is reported in `extensions.cost`.
+
+        If response cache is given, data of successful queries is kept in it
+        until any row it was built from changes, see api.graphql.cache.
+    """
+
+    def __init__(
+            self,
+            *args,
+            cache_size: int = 256,
+            persisted_queries: bool = False,
+            cost_analyzer: Optional[QueryCostAnalyzer] = None,
+            response_cache: Optional[ResponseCache] = None,
+            **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.documents = DocumentCache(cache_size)
+        self.persisted_queries = persisted_queries
+        self.cost_analyzer = cost_analyzer
+        self.response_cache = response_cache
+
+    def get_query_key(self, data: dict) -> Tuple[Optional[str], str]:
+        """ Get query text and its hash from request data """
+
+        query = data.get("query")
+        persisted = (data.get("extensions") or {}).get("persistedQuery")
+
+        if query is not None and (not isinstance(query, str) or not query):
+            raise GraphQLError("The query must be a string.")
+
+        if not persisted or not self.persisted_queries:
+            if query is None:
+                raise GraphQLError("The query must be a string.")
+            return query, hash_query(query)
+
+        key = persisted.get("sha256Hash")
+
+        if not isinstance(key, str):
+            raise GraphQLError("Persisted query hash must be a string.")
+
+        if query is not None and hash_query(query) != key:
+            raise GraphQLError("Provided sha256Hash does not match query")
+
+        return query, key
+
+    def get_document(self, data: dict, context_value: Any, timing: dict) -> Tuple[str, DocumentNode, List[GraphQLError]]:
+        query, key = self.get_query_key(data)
+
+        # rules built per request can't be cached together with the document
+        cacheable = not callable(self.validation_rules)
+
+        entry = self.documents.get(key)
+
+        if entry is not None:
+            document, errors = entry
+            timing["document_cache"] = "hit"
+        elif query is None:
+            raise GraphQLError("PersistedQueryNotFound")
+        else:
+            timing["document_cache"] = "miss"
+
+            start = time.perf_counter()
+            document = parse_query(query)
+            timing["parse_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            errors = None
+
+        if errors is None or not cacheable:
+            rules = self.validation_rules
+            if callable(rules):
+                rules = rules(context_value, document, data)
+
+            start = time.perf_counter()
+            errors = validate_query(self.schema, document, rules, enable_introspection=self.introspection)
+            timing["validate_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+        self.documents.put(key, document, errors if cacheable else None)
+
+        return key, document, errors
+
+    def get_response_key(self, query_key: str, document: DocumentNode, data: dict, context_value: Any) -> Optional[str]:
+        """ Get key of response in response cache, None if response can't be cached """
+
+        if self.response_cache is None:
+            return None
+
+        operation = get_operation_ast(document, data.get("operationName"))
+
+        if operation is None or operation.operation != OperationType.QUERY:
+            return None
+
+        viewer = get_context_viewer(context_value)
+
+        return self.response_cache.get_key(
+            query_key,
+            data.get("variables"),
+            data.get("operationName"),
+            viewer.id if viewer else None,
+        )
+
+    async def execute_graphql_query(self, request: Any, data: Any) -> GraphQLResult:
+        context_value = await self.get_context_for_request(request)
+        extensions = await self.get_extensions_for_request(request, context_value)
+        middleware = await self.get_middleware_for_request(request, context_value)
+
+        if self.schema is None:
+            raise TypeError("schema is not set, call configure method to initialize it")
+
+        extension_manager = ExtensionManager(extensions, context_value)
+        error_args = dict(
+            logger=self.logger,
+            error_formatter=self.error_formatter,
+            debug=self.debug,
+            extension_manager=extension_manager,
+        )
+
+        timing = {"parse_ms": 0, "validate_ms": 0}
+        cost = None
+        response_key = None
+        reads = None
+
+        with extension_manager.request():
+            try:
+                if not isinstance(data, dict):
+                    raise GraphQLError("Operation data should be a JSON object")
+
+                validate_variables(data.get("variables"))
+                validate_operation_name(data.get("operationName"))
+
+                query_key, document, validation_errors = self.get_document(data, context_value, timing)
+
+                if validation_errors:
+                    success, response = handle_graphql_errors(validation_errors, **error_args)
+                    return success, self.add_extensions(response, timing, cost)
+
+                # cost depends on variables, so it is not cached with the document
+                if self.cost_analyzer is not None:
+                    cost = {"requested": None, "maximum": self.cost_analyzer.max_cost}
+                    cost["requested"] = self.cost_analyzer.check(
+                        document, data.get("variables"), data.get("operationName")
+                    )
+
+                response_key = self.get_response_key(query_key, document, data, context_value)
+
+                if response_key is not None:
+                    cached = self.response_cache.get(response_key)
+                    timing["response_cache"] = "miss" if cached is None else "hit"
+
+                    if cached is not None:
+                        return True, self.add_extensions({"data": cached}, timing, cost)
+
+                    version = self.response_cache.version
+
+                root_value = self.root_value
+                if callable(root_value):
+                    root_value = root_value(context_value, document)
+                    if isawaitable(root_value):
+                        root_value = await root_value
+
+                with track_reads() as reads:
+                    result = execute(
+                        self.schema,
+                        document,
+                        root_value=root_value,
+                        context_value=context_value,
+                        variable_values=data.get("variables"),
+                        operation_name=data.get("operationName"),
+                        execution_context_class=ExecutionContext,
+                        middleware=extension_manager.as_middleware_manager(middleware),
+                    )
+
+                    if isawaitable(result):
+                        result = await result
+            except GraphQLError as error:
+                if cost is not None and cost["requested"] is None:
+                    cost["requested"] = (error.extensions or {}).get("cost")
+                success, response = handle_graphql_errors([error], **error_args)
+            else:
+                success, response = handle_query_result(result, **error_args)
+
+                # data that changed while query was executing could be partially stale
+                if (
+                        response_key is not None
+                        and success
+                        and not result.errors
+                        and reads.cacheable
+                        and version == self.response_cache.version
+                ):
+                    self.response_cache.put(response_key, response["data"], reads.tags)
+
+        logging.info(
+            f"GraphQL document {timing.get('document_cache')}: "
+            f"parse {timing['parse_ms']}ms, validate {timing['validate_ms']}ms"
+            + (f", cost {cost['requested']}" if cost else "")
+        )
+
+        return success, self.add_extensions(response, timing, cost)
+
+    @staticmethod
+    def add_extensions(response: dict, timing: dict, cost: Optional[dict]) -> dict:
+        extensions = response.setdefault("extensions", {})
+        extensions["timing"] = timing
+
+        if cost is not None:
+            extensions["cost"] = cost
+
+        return response
+
+
+class BudgetedGraphQLWSHandler(GraphQLWSHandler):
+    """ GraphQL websocket handler that rejects subscriptions over the cost budget, see QueryCostAnalyzer """
+
+    def __init__(self, *args, cost_analyzer: Optional[QueryCostAnalyzer] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cost_analyzer = cost_analyzer
+
+    def configure(self, *args, **kwargs):
+        super().configure(*args, **kwargs)
+
+        if self.cost_analyzer is None:
+            return
+
+        rules = self.validation_rules
+
+        def validation_rules(context_value, document, data):
+            base = rules(context_value, document, data) if callable(rules) else list(rules or [])
+            return [*base, *self.cost_analyzer.validation_rules(context_value, document, data)]
+
+        self.validation_rules = validation_rules
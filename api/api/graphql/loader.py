@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from typing import Dict, Type, List, Optional
+
+from django.db.models import Model, prefetch_related_objects
+
+from api.graphql.cache import exact_reads, record_read
+from api.graphql.planner import QueryPlan
+
+
+class ModelLoader:
+    """
+        Collects primary keys of one model that were requested during a single
+        GraphQL execution and loads all of them with one `id__in` query.
+
+        Keys are collected until the event loop gets back to the loader,
+        which happens after every sibling field of the current level was started.
+    """
+
+    def __init__(self, model: Type[Model]):
+        self.model = model
+
+        # every key ever requested during this execution
+        self._cache: Dict[int, asyncio.Future] = {}
+
+        # keys waiting for the next batch
+        self._pending: List[int] = []
+
+        # plans of every field waiting for the next batch, merged together
+        self._plan: Optional[QueryPlan] = None
+
+    def get_queryset(self, plan: Optional[QueryPlan] = None):
+        queryset = self.model.objects.all()
+
+        if plan is not None:
+            queryset = plan.apply(queryset)
+
+        return queryset
+
+    def load(self, pk, plan: Optional[QueryPlan] = None) -> asyncio.Future:
+        if pk in self._cache:
+            return self._cache[pk]
+
+        if plan is None:
+            plan = QueryPlan(only=None)
+
+        self._plan = plan if self._plan is None else self._plan.merge(plan)
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        self._cache[pk] = future
+        self._pending.append(pk)
+
+        # first key of a batch schedules the dispatch, the rest just join it
+        if len(self._pending) == 1:
+            loop.call_soon(self.dispatch)
+
+        return future
+
+    def load_many(self, pks, plan: Optional[QueryPlan] = None) -> asyncio.Future:
+        return asyncio.gather(*[self.load(pk, plan) for pk in pks])
+
+    def prime(self, instance: Model):
+        """ Put already loaded instance into cache, so it is never queried again """
+        if instance.pk in self._cache:
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        future.set_result(instance)
+        self._cache[instance.pk] = future
+
+    def dispatch(self):
+        pks, self._pending = self._pending, []
+        plan, self._plan = self._plan, None
+
+        logging.debug(f"load {len(pks)} {self.model.__name__} in one query with {plan}")
+
+        try:
+            # rows looked up by primary key are recorded one by one, so that responses
+            # that read them only go stale when these rows change, not the whole table
+            with exact_reads():
+                instances = self.get_queryset(plan).prefetch_related(None).in_bulk(pks)
+
+            if plan.prefetch:
+                prefetch_related_objects(list(instances.values()), *sorted(plan.prefetch))
+        except Exception as e:
+            for pk in pks:
+                self._cache.pop(pk).set_exception(e)
+            return
+
+        for pk in pks:
+            record_read(self.model, pk)
+
+        for instance in instances.values():
+            self.record_selected(instance, plan)
+
+        for pk in pks:
+            self._cache[pk].set_result(instances.get(pk))
+
+    @staticmethod
+    def record_selected(instance: Model, plan: QueryPlan):
+        """ Record rows that were joined to instance with select_related """
+
+        for path in plan.select:
+            related = instance
+            for name in path.split("__"):
+                related = getattr(related, name, None)
+                if related is None:
+                    break
+                record_read(type(related), related.pk)
+
+
+def get_loader(info, model: Type[Model]) -> ModelLoader:
+    """ Get loader of given model bound to current GraphQL request """
+
+    loaders = info.context.setdefault('loaders', {})
+
+    if model not in loaders:
+        loaders[model] = ModelLoader(model)
+
+    return loaders[model]
@@ -0,0 +1,187 @@
+import base64
+import json
+from collections.abc import Sequence
+from typing import List, Tuple, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q, QuerySet
+
+
+class Total:
+    """ How `count` of a page is computed """
+
+    # run COUNT(*) over whole queryset
+    EXACT = "exact"
+
+    # take row estimate from query planner, cheap but approximate
+    ESTIMATE = "estimate"
+
+    # do not count at all, page count is null
+    NONE = "none"
+
+
+def get_ordering(queryset: QuerySet) -> Optional[List[Tuple[str, bool]]]:
+    """
+        Get ordering of queryset as list of (lookup, descending) pairs with primary key
+        appended as a tie-breaker, so that every row has a unique position.
+        Returns None if ordering can't be used to seek, for example random ordering.
+    """
+
+    query = queryset.query
+    order_by = query.order_by or (query.get_meta().ordering if query.default_ordering else ())
+
+    ordering = []
+    for item in order_by:
+        if not isinstance(item, str) or item == "?":
+            return None
+
+        descending = item.startswith("-")
+        ordering.append((item.lstrip("-+"), descending))
+
+    if not any(lookup in ("pk", "id") for lookup, _ in ordering):
+        descending = ordering[-1][1] if ordering else False
+        ordering.append(("pk", descending))
+
+    return ordering
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps(list(values), cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError(f"Malformed cursor {cursor}")
+
+
+def seek(queryset: QuerySet, ordering: List[Tuple[str, bool]], values: list) -> QuerySet:
+    """
+        Filter queryset to rows that come strictly after the row with given ordering values.
+        NULLs are considered larger than any value, like PostgreSQL sorts them.
+    """
+
+    if len(values) != len(ordering):
+        raise ValueError("Cursor does not match ordering of this list")
+
+    condition = Q(pk__in=[])
+
+    for i, (lookup, descending) in enumerate(ordering):
+        value = values[i]
+
+        if value is None:
+            # nothing is larger than NULL, but everything is smaller
+            after = Q(**{f"{lookup}__isnull": False}) if descending else Q(pk__in=[])
+        elif descending:
+            after = Q(**{f"{lookup}__lt": value})
+        else:
+            after = Q(**{f"{lookup}__gt": value}) | Q(**{f"{lookup}__isnull": True})
+
+        # all previous columns are equal to ones in cursor
+        for j, (prev_lookup, _) in enumerate(ordering[:i]):
+            after &= Q(**{prev_lookup: values[j]})
+
+        condition |= after
+
+    return queryset.filter(condition)
+
+
+def estimate_count(queryset: QuerySet) -> int:
+    """ Get number of rows query planner expects queryset to return """
+
+    connection = connections[queryset.db]
+
+    if connection.vendor != "postgresql":
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return plan[0]["Plan"]["Plan Rows"]
+
+
+def count_queryset(queryset: QuerySet, total: str) -> Optional[int]:
+    if total == Total.EXACT:
+        return queryset.count()
+
+    if total == Total.ESTIMATE:
+        return estimate_count(queryset)
+
+    if total == Total.NONE:
+        return None
+
+    raise ValueError(f"Unknown total mode {total}")
+
+
+class MappedQuerySet:
+    """
+        Queryset of ids whose page items have to be converted to something else,
+        like a virtual table. Only items of requested page are ever converted.
+    """
+
+    def __init__(self, queryset: QuerySet, mapper):
+        self.queryset = queryset
+        self.mapper = mapper
+
+
+def paginate(data, page: int, size: int, after: str = None, total: str = Total.EXACT):
+    """
+        Get one page of ids from a list or queryset.
+
+        Querysets are paginated by offset, or by seeking past the row encoded in `after` cursor
+        if it is given. Empty cursor means the very first page. Either way the cursor of the
+        last returned row is given back, so that next page can be requested without OFFSET.
+
+        :return: tuple of (count, ids, cursor)
+    """
+
+    if isinstance(data, MappedQuerySet):
+        count, ids, cursor = paginate(data.queryset, page, size, after, total)
+        return count, [data.mapper(item) for item in ids], cursor
+
+    if isinstance(data, Sequence):
+        if after is None:
+            return len(data), data[page * size: (page + 1) * size], None
+
+        # list that knows position of its items, like a leaderboard
+        if not hasattr(data, "seek"):
+            raise ValueError("Cursor pagination is not supported for this list")
+
+        rows = data.seek(decode_cursor(after) if after else None, size)
+        cursor = encode_cursor(rows[-1][1:]) if rows else None
+
+        return len(data), [row[0] for row in rows], cursor
+
+    ordering = get_ordering(data)
+
+    if ordering is None:
+        if after is not None:
+            raise ValueError("Cursor pagination is not supported for this ordering")
+
+        ids = data.values_list('id', flat=True)[page * size:page * size + size]
+        return count_queryset(data, total), ids, None
+
+    count = count_queryset(data, total)
+
+    data = data.order_by(*[("-" if descending else "") + lookup for lookup, descending in ordering])
+    keys = [lookup for lookup, _ in ordering]
+
+    if after is None:
+        rows = list(data.values_list('id', *keys)[page * size:page * size + size])
+    else:
+        if after:
+            data = seek(data, ordering, decode_cursor(after))
+        rows = list(data.values_list('id', *keys)[:size])
+
+    cursor = encode_cursor(rows[-1][1:]) if rows else None
+
+    return count, [row[0] for row in rows], cursor
@@ -0,0 +1,81 @@
+from typing import Set, Optional, Iterable
+
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+class QueryPlan:
+    """
+        Describes how a queryset has to be built so that selected fields
+        can be resolved without going back to the database for every row.
+
+        `only` is a set of columns to load, None means every column is needed.
+    """
+
+    def __init__(self, only: Optional[Iterable[str]] = (), select: Iterable[str] = (), prefetch: Iterable[str] = ()):
+        self.only = set(only) if only is not None else None
+        self.select = set(select)
+        self.prefetch = set(prefetch)
+
+    def merge(self, other: "QueryPlan") -> "QueryPlan":
+        if self.only is None or other.only is None:
+            only = None
+        else:
+            only = self.only | other.only
+
+        return QueryPlan(
+            only=only,
+            select=self.select | other.select,
+            prefetch=self.prefetch | other.prefetch,
+        )
+
+    def apply(self, queryset):
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*sorted(self.prefetch))
+
+        # deferring columns of joined tables would make every
+        # related object load its own fields later, so skip it
+        if self.only is not None and not self.select:
+            queryset = queryset.only(*sorted(self.only))
+
+        return queryset
+
+    def __repr__(self):
+        return f"<QueryPlan only={self.only} select={self.select} prefetch={self.prefetch}>"
+
+
+def get_selected_fields(info, type_name: str = None) -> Set[str]:
+    """
+        Get names of fields selected on the object returned by current field.
+        Fragments are expanded, ones that target other types are skipped.
+    """
+
+    names = set()
+
+    for node in info.field_nodes:
+        if node.selection_set:
+            _collect_fields(info, node.selection_set, type_name, names)
+
+    return names
+
+
+def _type_matches(type_condition, type_name):
+    return type_condition is None or type_name is None or type_condition.name.value == type_name
+
+
+def _collect_fields(info, selection_set, type_name, names):
+    for selection in selection_set.selections:
+
+        if isinstance(selection, FieldNode):
+            names.add(selection.name.value)
+
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments[selection.name.value]
+            if _type_matches(fragment.type_condition, type_name):
+                _collect_fields(info, fragment.selection_set, type_name, names)
+
+        elif isinstance(selection, InlineFragmentNode):
+            if _type_matches(selection.type_condition, type_name):
+                _collect_fields(info, selection.selection_set, type_name, names)
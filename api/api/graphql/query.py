@@ -2,12 +2,18 @@ import inspect
 import json
 from typing import List, TypeVar, Generic, get_args, Type, Tuple, Optional
 
-from ariadne import QueryType, make_executable_schema, ObjectType
+from ariadne import QueryType, make_executable_schema, ObjectType, SubscriptionType
+from django.conf import settings
 from django.db.models import Q, Sum, Count, F
 
+from api.graphql.cache import exact_reads, record_read
+from api.graphql.pagination import MappedQuerySet
 from api.graphql.virtual import TableManager, VirtualTable, Table, computed, PaginatedTable, VirtualGenericTable
 from api.models import Player, Team, Role, PlayerPermission, Game, InGameTeam, PlayerSession, Event, Match, Invite, \
-    MapPickProcess, MapPick, GamePlayerEvent, PlayerQueue, MatchTeam, Post, Map
+    MapPickProcess, MapPick, GamePlayerEvent, PlayerQueue, MatchTeam, Post, Map, PlayerStats
+from api.services.leaderboard import get_leaderboard, Leaderboard
+from api.services.mode_stats import ModeStatsSnapshot, ModeStats
+from api.services.stats import get_player_stats
 
 tableManager = TableManager()
 
@@ -19,9 +25,13 @@ class Page(Generic[T], VirtualGenericTable):
     count: int
     items: List[T]
 
-    def __init__(self, count: int, items: List[T]):
+    # position of the last item, pass it as `after` to get next page
+    cursor: Optional[str]
+
+    def __init__(self, count: int, items: List[T], cursor: str = None):
         self.count = count
         self.items = items
+        self.cursor = cursor
 
 
 @tableManager.table
@@ -54,20 +64,24 @@ class PlayerTable(Table[Player]):
     elo: int
     role_id: int
     team_id: int
-    owned_team_id: int
     in_server: bool
 
-    @computed
+    @computed(prefetch=['teams'])
+    def owned_team_id(self) -> Optional[int]:
+        teams = self.teams.all()
+        if teams:
+            return teams[0].id
+
+    @computed(cost=2)
     def game_id(self) -> Optional[int]:
         game = self.get_active_game()
         if game:
             return game.id
 
-    @computed
+    @computed(cacheable=False)
     def on_website(self) -> bool:
         from api.consumers import WsPool
-        conn = WsPool.get_player_conn(self)
-        return conn is not None
+        return WsPool.is_online(self.id)
 
 
 @tableManager.table
@@ -83,9 +97,9 @@ class RoleTable(Table[Role]):
     chat_message_color: str
     team_override_color: bool
 
-    @computed
+    @computed(prefetch=['permissions'])
     def permission_ids(self) -> List[int]:
-        return self.permissions.values_list('id', flat=True)
+        return [p.id for p in self.permissions.all()]
 
 
 @tableManager.table
@@ -162,6 +176,8 @@ class Config(VirtualTable):
 
 @tableManager.table
 class GameTable(Table[Game]):
+    depends_on = (PlayerSession,)
+
     id: int
     map_id: int
     is_finished: bool
@@ -173,16 +189,17 @@ class GameTable(Table[Game]):
     plugins: List[str]
     score_a: int
     score_b: int
+    server_id: int
 
-    @computed
+    @computed(prefetch=['sessions'])
     def session_ids(self) -> List[int]:
         return [s.id for s in self.sessions.all()]
 
-    @computed
+    @computed(prefetch=['blacklist'])
     def blacklist_ids(self) -> List[int]:
         return [p.id for p in self.blacklist.all()]
 
-    @computed
+    @computed(prefetch=['whitelist'])
     def whitelist_ids(self) -> List[int]:
         return [p.id for p in self.whitelist.all()]
 
@@ -202,7 +219,7 @@ class MapPickProcessTable(Table[MapPickProcess]):
     next_action: int
     turn_id: int
 
-    @computed
+    @computed(select=['match'])
     def match_id(self) -> int:
         return self.match.id
 
@@ -227,9 +244,9 @@ class InGameTeamTable(Table[InGameTeam]):
     starts_as_ct: bool
     is_ct: bool
 
-    @computed
+    @computed(prefetch=['sessions'])
     def player_ids(self) -> List[int]:
-        return [p.player.id for p in self.sessions.all()]
+        return [s.player_id for s in self.sessions.all()]
 
 
 @tableManager.table
@@ -292,18 +309,19 @@ class ManyToOne(PaginatedTable[int]):
         from django.apps import apps
 
         if id is None and field is None:
-            model = apps.get_model('api', model).objects.all()
-            ids = [m.id for m in model]
+            items = apps.get_model('api', model).objects.order_by('id')
         else:
             model = apps.get_model('api', model).objects.get(id=id)
-            ids = [getattr(obj, 'id') for obj in getattr(model, field).all()]
+            items = getattr(model, field).order_by('id')
 
-        super().__init__(ids, page, size)
+        super().__init__(items, page, size)
 
 
 @tableManager.table
 class PlayerPerformanceAggregatedView(VirtualTable):
     """ Player stats optionally inside a game """
+    depends_on = (PlayerStats, GamePlayerEvent)
+
     player_id: int
     kills: int
     deaths: int
@@ -314,52 +332,44 @@ class PlayerPerformanceAggregatedView(VirtualTable):
         self.player_id = player_id
         self.game_id = game_id
 
-        print(f"get player performance for {player_id} in {game_id}")
-
-        stats = GamePlayerEvent.objects.all()
-
-        if self.player_id:
-            stats = stats.filter(player_id=self.player_id)
+        # totals are materialized, so this is one primary key read
+        with exact_reads():
+            self.stats = get_player_stats(player_id)
+        record_read(PlayerStats, player_id)
 
         if self.game_id:
-            stats = stats.filter(game_id=self.game_id)
-
-        for s in stats:
-            print(s.player, s.event)
-
-        aggregated_stats = stats.filter(player_id=player_id).aggregate(
-            kills=Count('id', filter=Q(event='KILL')),
-            deaths=Count('id', filter=Q(event='DEATH')),
-            assists=Count('id', filter=Q(event='ASSIST')),
-            hs=Count('id', filter=Q(meta__hs=True))
-        )
-
-        self.player_id = player_id
-        self.kills = aggregated_stats['kills']
-        self.deaths = aggregated_stats['deaths']
-        self.assists = aggregated_stats['assists']
+            # stats inside one game are bounded by length of a game
+            aggregated_stats = GamePlayerEvent.objects.filter(player_id=player_id, game_id=self.game_id).aggregate(
+                kills=Count('id', filter=Q(event='KILL')),
+                deaths=Count('id', filter=Q(event='DEATH')),
+                assists=Count('id', filter=Q(event='ASSIST')),
+                headshots=Count('id', filter=Q(meta__hs=True))
+            )
+            stats = PlayerStats(**aggregated_stats)
+        else:
+            stats = self.stats
 
-        headshots = aggregated_stats['hs']
-        self.hs = (headshots / self.kills) if headshots else 0
-        self.hs *= 100
-        self.hs = round(self.hs, 2)
+        self.kills = stats.kills
+        self.deaths = stats.deaths
+        self.assists = stats.assists
+        self.hs = stats.hs
 
     @computed
     def games_played(self) -> int:
         # temporary, possible to abuse by spamming sessions
-        return PlayerSession.objects.filter(player_id=self.player_id).count()
+        return self.stats.games_played
 
     @computed
     def games_won(self) -> int:
-        return PlayerSession.objects.filter(player_id=self.player_id, roster=F('game__winner')).count()
+        return self.stats.games_won
 
     @computed
     def ranked_games_played(self) -> int:
-        return PlayerSession.objects.filter(player_id=self.player_id, game__plugins__contains='RankedPlugin').count()
+        return self.stats.ranked_games_played
 
     @computed
     def ranked_games_won(self) -> int:
-        return PlayerSession.objects.filter(player_id=self.player_id, roster=F('game__winner'), game__plugins__contains='RankedPlugin').count()
+        return self.stats.ranked_games_won
 
 
 @tableManager.table
@@ -374,6 +384,7 @@ class PlayerStatId(VirtualTable):
 
 @tableManager.table
 class GameStatsView(VirtualTable):
+    depends_on = (PlayerSession,)
 
     def __init__(self, game_id: int = None, in_game_team_id: int = None, player_id: int = None):
         self.game_id = game_id
@@ -384,20 +395,34 @@ class GameStatsView(VirtualTable):
     def stats(self) -> List[PlayerStatId]:
 
         # players to retrieve stats for
-        players = set()
+        players = Q(pk__in=[])
 
         if self.player_id:
-            players.add(self.player_id)
+            players |= Q(id=self.player_id)
 
         if self.in_game_team_id:
-            team: InGameTeam = InGameTeam.objects.get(id=self.in_game_team_id)
-            players.update(team.sessions.all().values_list('player_id', flat=True))
+            sessions = PlayerSession.objects.filter(roster_id=self.in_game_team_id)
+            players |= Q(id__in=sessions.values('player_id'))
 
         if self.game_id:
-            for team in InGameTeam.objects.filter(game_id=self.game_id):
-                players.update(team.sessions.all().values_list('player_id', flat=True))
+            # players of both in-game teams
+            sessions = PlayerSession.objects.filter(game_id=self.game_id, roster__isnull=False)
+            players |= Q(id__in=sessions.values('player_id'))
+
+        return MappedQuerySet(
+            Player.objects.filter(players).order_by('id'),
+            lambda player_id: PlayerStatId(player_id, self.game_id)
+        )
 
-        return [PlayerStatId(player, self.game_id) for player in players]
+
+# orderings that can be served from in-memory leaderboard, by whether they are descending
+LEADERBOARD_ORDERINGS = {'-elo': True, 'elo': False}
+
+
+def read_leaderboard(model) -> Leaderboard:
+    """ In-memory leaderboard of model, recorded as a read of the whole table """
+    record_read(model)
+    return get_leaderboard(model)
 
 
 @tableManager.table
@@ -413,23 +438,50 @@ class TopTeamView(TeamTable):
 
     @classmethod
     def resolve(cls, __parent=None, order_by: str = '-elo'):
-        return Team.objects.all().order_by(order_by).first()
+        if order_by not in LEADERBOARD_ORDERINGS:
+            return Team.objects.all().order_by(order_by).first()
+
+        ids = read_leaderboard(Team).ids(LEADERBOARD_ORDERINGS[order_by])
+        if not ids:
+            return None
+
+        return Team.objects.filter(pk=ids[0]).first()
 
 
 @tableManager.table
 class TopPlayersView(VirtualTable):
+    depends_on = (Player,)
 
     def __init__(self, order_by: str):
         self.order_by = order_by
 
     @computed(paginate=True)
     def player_ids(self) -> List[int]:
+        if self.order_by in LEADERBOARD_ORDERINGS:
+            return read_leaderboard(Player).ids(LEADERBOARD_ORDERINGS[self.order_by])
+
         return Player.objects.all().order_by(self.order_by)
 
+    @computed
+    def rank(self, player_id: int) -> Optional[int]:
+        """ Position of player by elo, starting from 1 """
+        return read_leaderboard(Player).rank(player_id)
+
+
+def get_mode_stats(mode: int) -> ModeStats:
+    """ Stats of game mode from in-memory snapshot, refreshed when games or sessions change """
+
+    # nothing is queried when snapshot is fresh, so record what it is built from
+    record_read(Game)
+    record_read(PlayerSession)
+
+    return ModeStatsSnapshot.get(mode)
+
 
 @tableManager.table
 class PubsView(VirtualTable):
     """ View of all games that don't have any plugins and can be joined by anyone """
+    depends_on = (Game, PlayerSession)
 
     def __init__(self):
         pass
@@ -440,15 +492,12 @@ class PubsView(VirtualTable):
 
     @computed
     def online_player_count(self) -> int:
-        return PlayerSession.objects.filter(
-            game__mode=Game.Mode.PUB,
-            status=PlayerSession.Status.PARTICIPATING,
-            state=PlayerSession.State.IN_GAME
-        ).count()
+        return get_mode_stats(Game.Mode.PUB).online
 
 
 @tableManager.table
 class DeathMatchView(VirtualTable):
+    depends_on = (Game, PlayerSession)
 
     def __init__(self):
         pass
@@ -459,15 +508,12 @@ class DeathMatchView(VirtualTable):
 
     @computed
     def online_player_count(self) -> int:
-        return PlayerSession.objects.filter(
-            game__mode=Game.Mode.DEATHMATCH,
-            status=PlayerSession.Status.PARTICIPATING,
-            state=PlayerSession.State.IN_GAME
-        ).count()
+        return get_mode_stats(Game.Mode.DEATHMATCH).online
 
 
 @tableManager.table
 class DuelsView(VirtualTable):
+    depends_on = (Game, PlayerSession)
 
     def __init__(self):
         pass
@@ -478,70 +524,52 @@ class DuelsView(VirtualTable):
 
     @computed
     def online_player_count(self) -> int:
-        return PlayerSession.objects.filter(
-            game__mode=Game.Mode.DUELS,
-            status=PlayerSession.Status.PARTICIPATING,
-            state=PlayerSession.State.IN_GAME
-        ).count()
+        return get_mode_stats(Game.Mode.DUELS).online
 
 
 @tableManager.table
 class GameModeStatsView(VirtualTable):
+    depends_on = (Game, PlayerSession)
 
     def __init__(self):
         pass
 
     @computed
     def ranked_online(self) -> int:
-        return PlayerSession.objects.filter(
-            game__mode=Game.Mode.RANKED,
-            status=PlayerSession.Status.PARTICIPATING,
-            state=PlayerSession.State.IN_GAME
-        ).count()
+        return get_mode_stats(Game.Mode.RANKED).online
 
     @computed
     def pubs_online(self) -> int:
-        return PlayerSession.objects.filter(
-            game__mode=Game.Mode.PUB,
-            status=PlayerSession.Status.PARTICIPATING,
-            state=PlayerSession.State.IN_GAME
-        ).count()
+        return get_mode_stats(Game.Mode.PUB).online
 
     @computed
     def duels_online(self) -> int:
-        return PlayerSession.objects.filter(
-            game__mode=Game.Mode.DUELS,
-            status=PlayerSession.Status.PARTICIPATING,
-            state=PlayerSession.State.IN_GAME
-        ).count()
+        return get_mode_stats(Game.Mode.DUELS).online
 
     @computed
     def deathmatch_online(self) -> int:
-        return PlayerSession.objects.filter(
-            game__mode=Game.Mode.DEATHMATCH,
-            status=PlayerSession.Status.PARTICIPATING,
-            state=PlayerSession.State.IN_GAME
-        ).count()
+        return get_mode_stats(Game.Mode.DEATHMATCH).online
 
     @computed
     def ranked_games(self) -> int:
-        return Game.objects.filter(mode=Game.Mode.RANKED).exclude(status=Game.Status.FINISHED).count()
+        return get_mode_stats(Game.Mode.RANKED).games
 
     @computed
     def pubs_games(self) -> int:
-        return Game.objects.filter(mode=Game.Mode.PUB).exclude(status=Game.Status.FINISHED).count()
+        return get_mode_stats(Game.Mode.PUB).games
 
     @computed
     def duels_games(self) -> int:
-        return Game.objects.filter(mode=Game.Mode.DUELS).exclude(status=Game.Status.FINISHED).count()
+        return get_mode_stats(Game.Mode.DUELS).games
 
     @computed
     def deathmatch_games(self) -> int:
-        return Game.objects.filter(mode=Game.Mode.DEATHMATCH).exclude(status=Game.Status.FINISHED).count()
+        return get_mode_stats(Game.Mode.DEATHMATCH).games
 
 
 @tableManager.table
 class RankedView(VirtualTable):
+    depends_on = (PlayerQueue, PlayerQueue.players.through)
 
     def __init__(self):
         pass
@@ -611,6 +639,10 @@ type_defs = """
         id: Int
     }
 
+    type Subscription {
+""" + tableManager.get_graphql_subscriptions() + """
+    }
+
 """ + tableManager.get_graphql_responses() + """
     
 """
@@ -621,22 +653,9 @@ print(type_defs)
 
 tableManager.define_resolvers(query)
 
+subscription = SubscriptionType()
 
-@query.field("player")
-def resolve_player(_, info, id):
-    player = Player.objects.get(id=id)
-    owned_team = Team.objects.filter(owner=player).first()
-    if owned_team:
-        player.owned_team_id = owned_team.id
-    else:
-        player.owned_team_id = None
-
-    return player
-
-
-@query.field("event")
-def resolve_event(_, info, id):
-    return Event.objects.get(id=id)
+tableManager.define_subscriptions(subscription)
 
 
 @query.field("player_ids")
@@ -665,29 +684,40 @@ def resolve_match(_, info):
 
 
 @query.field("server")
-def resolve_team(_, info, id):
-    return {}
+def resolve_server(_, info, id=None):
+    return {"id": id or settings.BUKKIT_DEFAULT_SERVER}
 
 
 server = ObjectType("Server")
 
 
+def get_server_games(server_id: int):
+    """ Unfinished games hosted by server, games without server are hosted by the default one """
+
+    hosted_here = Q(server_id=server_id)
+
+    if server_id == settings.BUKKIT_DEFAULT_SERVER:
+        hosted_here |= Q(server_id__isnull=True)
+
+    return Game.objects.filter(hosted_here).exclude(status=Game.Status.FINISHED)
+
+
 @server.field("id")
 def resolve_server_id(obj, info):
-    return 1
+    return obj["id"]
 
 
 @server.field("games")
 def resolve_lobbies(obj, info):
-    return Game.objects.exclude(status=Game.Status.FINISHED)
+    return get_server_games(obj["id"])
 
 
 @server.field("game_ids")
 def resolve_lobbies_ids(obj, info):
-    return [x.id for x in Game.objects.exclude(status=Game.Status.FINISHED)]
+    return [x.id for x in get_server_games(obj["id"])]
 
 
 # Create executable schema instance
 schema = make_executable_schema(
-    type_defs, query, server, *tableManager.get_gql_objects()
+    type_defs, query, subscription, server, *tableManager.get_gql_objects()
 )
@@ -0,0 +1,98 @@
+import asyncio
+from typing import Set, List, Optional, Type, Dict, Tuple
+
+from django.conf import settings
+from django.db.models import Model
+
+
+class ModelChange:
+    """ Row of a model that was created, updated or deleted. pk is None if unknown, like for m2m tables. """
+
+    def __init__(self, model: Type[Model], pk: Optional[int], action: str):
+        self.model = model
+        self.pk = pk
+        self.action = action
+
+    def __repr__(self):
+        return f"<ModelChange {self.action} {self.model.__name__} {self.pk}>"
+
+
+class ChangeListener:
+    """
+        Model changes for one GraphQL subscription. Repeated changes of a row are kept once,
+        and once more than `max_size` rows changed, they are forgotten and listener only
+        remembers that it has overflowed.
+    """
+
+    def __init__(self, max_size: int):
+        self.loop = asyncio.get_event_loop()
+        self.max_size = max_size
+
+        self.changes: Dict[Tuple[Type[Model], Optional[int]], ModelChange] = {}
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def put(self, change: ModelChange):
+        # signals can be sent from a worker thread
+        self.loop.call_soon_threadsafe(self._add, change)
+
+    def _add(self, change: ModelChange):
+        key = (change.model, change.pk)
+
+        if key not in self.changes and len(self.changes) >= self.max_size:
+            self.changes.clear()
+            self.overflowed = True
+        elif not self.overflowed:
+            self.changes[key] = change
+
+        self.ready.set()
+
+    async def get(self) -> Optional[List[ModelChange]]:
+        """ Wait for changes, return every change that piled up since last call, None if there were too many """
+
+        await self.ready.wait()
+        self.ready.clear()
+
+        changes, self.changes = self.changes, {}
+
+        if self.overflowed:
+            self.overflowed = False
+            return None
+
+        return list(changes.values())
+
+    def close(self):
+        ModelChanges.unlisten(self)
+
+
+class ModelChanges:
+    """ Fan out of model signals to GraphQL subscriptions """
+
+    _listeners: Set[ChangeListener] = set()
+
+    @classmethod
+    def listen(cls) -> ChangeListener:
+        listener = ChangeListener(settings.GRAPHQL_SUBSCRIPTION_QUEUE_SIZE)
+        cls._listeners.add(listener)
+        return listener
+
+    @classmethod
+    def unlisten(cls, listener: ChangeListener):
+        cls._listeners.discard(listener)
+
+    @classmethod
+    def publish(cls, model: Type[Model], pk: Optional[int], action: str):
+        if not cls._listeners:
+            return
+
+        change = ModelChange(model, pk, action)
+
+        for listener in list(cls._listeners):
+            listener.put(change)
+
+
+def on_connect(websocket, payload):
+    """ Browsers can't set headers of a websocket, so session is sent in connection params """
+
+    if isinstance(payload, dict) and payload.get("session_id"):
+        websocket.scope["session_id"] = payload["session_id"]
@@ -8,12 +8,47 @@ from collections import defaultdict
 from typing import TypeVar, Generic, List, get_args, Tuple, Type, Optional, Union
 from starlette.requests import Request
 
-from ariadne import ObjectType
-
+from ariadne import ObjectType, UnionType, SubscriptionType
+
+from api.graphql.cache import mark_uncacheable
+from api.graphql.loader import get_loader
+from api.graphql import pagination
+from api.graphql.pagination import Total
+from api.graphql.planner import QueryPlan, get_selected_fields
+from api.graphql.subscription import ModelChanges, ModelChange
 from api.services.auth import get_player
 
 
-def computed(method=None, *, paginate=False):
+def get_viewer(info):
+    return get_context_viewer(info.context)
+
+
+def get_context_viewer(context: dict):
+    """ Get player that makes this GraphQL request. Looked up once per request. """
+
+    if 'player' not in context:
+        request: Optional[Request] = context.get("request")
+        # websocket clients pass session in connection params, see subscription.on_connect
+        session_id = request.headers.get('session_id') or request.scope.get('session_id')
+        context['player'] = get_player(session_id)
+
+    return context['player']
+
+
+def computed(method=None, *, paginate=False, fields=(), select=(), prefetch=(), cost=1, cacheable=True):
+    """
+        Expose method as a field of GraphQL type.
+
+        @param paginate: wrap returned list or queryset into a Page
+        @param cost: how expensive field is to resolve, counted towards query cost budget
+        @param cacheable: False if field depends on something besides database,
+                          responses that contain it are never cached
+        @param fields: model columns this method reads besides primary key
+        @param select: relations to join when table is loaded, see select_related
+        @param prefetch: relations to prefetch when table is loaded, see prefetch_related
+    """
+
+    hints = QueryPlan(only=fields, select=select, prefetch=prefetch)
 
     def register_computed_method(f):
         sig = inspect.signature(f)
@@ -36,10 +71,18 @@ def computed(method=None, *, paginate=False):
             param_sig
         ]
 
+        f._query_hints = hints
+        f._cost = cost
+        f._cacheable = cacheable
+
     if not method:
 
         if not paginate:
-            return computed
+            def decorator(method):
+                register_computed_method(method)
+                return method
+
+            return decorator
 
         def real_decorator(method):
             from api.graphql.query import Page
@@ -63,17 +106,34 @@ def computed(method=None, *, paginate=False):
                         kind=inspect.Parameter.KEYWORD_ONLY,
                         default=10,
                         annotation=int,
+                    ),
+                    inspect.Parameter(
+                        name="after",
+                        kind=inspect.Parameter.KEYWORD_ONLY,
+                        default=None,
+                        annotation=Optional[str],
+                    ),
+                    inspect.Parameter(
+                        name="total",
+                        kind=inspect.Parameter.KEYWORD_ONLY,
+                        default=Total.EXACT,
+                        annotation=str,
                     )
                 ],
                 return_annotation=Page[returned_type]
             )
 
-            def paginated_prop(self, page: int = 0, size: int = 10, **kwargs) -> Page[returned_type]:
+            def paginated_prop(
+                    self,
+                    page: int = 0,
+                    size: int = 10,
+                    after: Optional[str] = None,
+                    total: str = Total.EXACT,
+                    **kwargs
+            ) -> Page[returned_type]:
                 data = method(self, **kwargs)
-                if isinstance(data, list):
-                    return Page(len(data), data[page * size: (page + 1) * size])
-
-                return Page(data.count(), data.values_list('id', flat=True)[page * size:page * size + size])
+                count, items, cursor = pagination.paginate(data, page, size, after, total)
+                return Page(count, items, cursor)
 
             paginated_prop.__signature__ = new_sig
             paginated_prop.__name__ = method.__name__
@@ -153,8 +213,27 @@ class TableManager:
                 print(f"Error while generating graphql request for {model.__name__}")
                 raise e
 
+        if self.get_node_tables():
+            requests.append("nodes(type: String!, ids: [Int!]!): [Node]\n")
+
         return "\n".join(requests)
 
+    def get_subscribable(self):
+        """ Tables that know which model changes affect them """
+        return [model for model in self.queryable if model.get_dependencies()]
+
+    def get_graphql_subscriptions(self):
+        """ Every subscribable table can be subscribed to with same arguments it is queried with """
+        return "\n".join(model.create_graphql_request() for model in self.get_subscribable())
+
+    def get_node_tables(self):
+        """ Tables that represent database models and can be fetched in bulk with `nodes` query """
+        return {
+            model.get_type_name(): model
+            for model in self.queryable
+            if issubclass(model, Table) and model.get_type_name() == model.get_model_type().__name__
+        }
+
     def get_graphql_responses(self):
         typedefs = ""
         compiled = set()
@@ -171,27 +250,107 @@ class TableManager:
             model = self.models_to_process.pop(key)
             typedefs += model.create_graphql_response()
 
+        node_tables = self.get_node_tables()
+        if node_tables:
+            typedefs += f"union Node = {' | '.join(node_tables)}\n"
+
         return typedefs
 
+    def get_field_costs(self):
+        """ Weights of generated fields by type name, used to compute query cost """
+
+        costs = {"Query": {}}
+
+        for model in self.models:
+            costs[model.get_type_name()] = {
+                name: getattr(prop, '_cost', 1)
+                for name, prop, return_type, args in model.get_custom_resolvers()
+            }
+
+        for model in self.queryable:
+            costs["Query"][model.get_field_name()] = model.cost
+
+        # subscription is resolved like query of the same table on every push
+        subscribable = self.get_subscribable()
+        if subscribable:
+            costs["Subscription"] = {model.get_field_name(): model.cost for model in subscribable}
+
+        if self.get_node_tables():
+            costs["Query"]["nodes"] = 1
+
+        return costs
+
+    def define_subscriptions(self, subscription: SubscriptionType):
+
+        def make_subscription(model):
+            name = model.get_field_name()
+
+            async def source(_, info, **fields):
+                # listen before first push, so that no change is missed in between
+                listener = ModelChanges.listen()
+                try:
+                    yield None
+
+                    while True:
+                        changes = await listener.get()
+
+                        # subscriber fell behind, it is not known what changed
+                        if changes is None or any(model.is_affected_by(change, **fields) for change in changes):
+                            yield None
+                finally:
+                    listener.close()
+
+            async def resolve(_, info, **fields):
+                # every push must see fresh rows, not ones loaded for the previous push
+                info.context.pop('loaders', None)
+                return await model.load_with_context(info, **fields)
+
+            subscription.source(name)(source)
+            subscription.field(name)(resolve)
+
+        for model in self.get_subscribable():
+            make_subscription(model)
+
     def define_resolvers(self, query):
 
         # Oh, no! python's closures are broken!
         def make_handler(model):
             dec = query.field(model.get_field_name())
 
-            def resolve_thing(_, info, **fields):
-                return model.resolve_with_context(info, **fields)
+            async def resolve_thing(_, info, **fields):
+                return await model.load_with_context(info, **fields)
 
             dec(resolve_thing)
 
         def make_resolver(gql_obj, name, prop, args):
             dec = gql_obj.field(name)
 
+            cacheable = getattr(prop, '_cacheable', True)
+
             def test(obj, **kwargs):
+                if not cacheable:
+                    mark_uncacheable()
                 return prop(obj, **kwargs)
 
             dec(lambda obj, info, **kwargs: test(obj, **kwargs))
 
+        node_tables = {name.lower(): model for name, model in self.get_node_tables().items()}
+
+        if node_tables:
+
+            @query.field("nodes")
+            async def resolve_nodes(_, info, type, ids):
+                model = node_tables.get(type.lower())
+
+                if model is None:
+                    raise ValueError(f"Unknown node type {type}")
+
+                return await model.load_many_with_context(info, ids)
+
+            node = UnionType("Node")
+            node.set_type_resolver(lambda obj, *_: type(obj).__name__)
+            self.gql_objects.append(node)
+
         for model in self.queryable:
             make_handler(model)
 
@@ -292,6 +451,12 @@ def format_typed_arg(typed_arg, field_owner=None):
 class AbstractTable:
     _computed_props = defaultdict(list)
 
+    # weight of looking this table up from the root of a query
+    cost = 1
+
+    # models whose changes are pushed to subscribers of this table
+    depends_on = ()
+
     @classmethod
     def create_graphql_request(cls):
         """
@@ -347,17 +512,35 @@ class AbstractTable:
         cls.resolve_children(model)
         return model
 
+    @classmethod
+    async def load(cls, __info=None, **fields):
+        """ Resolve upper level of model, giving table a chance
+            to batch its lookup with other fields of the same request """
+        return cls.resolve(None, **fields)
+
     @classmethod
     def resolve_with_context(cls, __info=None, **fields):
         obj = cls.resolve_recursively(None, **fields)
+        return cls.attach_context(obj, __info)
+
+    @classmethod
+    async def load_with_context(cls, __info=None, **fields):
+        obj = await cls.load(__info, **fields)
 
+        if obj is not None:
+            cls.resolve_children(obj)
+
+        return cls.attach_context(obj, __info)
+
+    @classmethod
+    def attach_context(cls, obj, __info=None):
         if obj is not None:
 
             player = None
             request: Optional[Request] = None
             if __info:
                 request = __info.context.get("request")
-                player = get_player(request.headers.get('session_id'))
+                player = get_viewer(__info)
 
             obj.context = {
                 'player': player,
@@ -366,6 +549,15 @@ class AbstractTable:
 
         return obj
 
+    @classmethod
+    def get_dependencies(cls) -> Tuple[Type, ...]:
+        return cls.depends_on
+
+    @classmethod
+    def is_affected_by(cls, change: ModelChange, **fields) -> bool:
+        """ Check whether subscribers of table with given arguments have to get new values """
+        return change.model in cls.get_dependencies()
+
     @classmethod
     def get_field_name(cls):
         return cls.__name__[0].lower() + cls.__name__[1:]
@@ -436,6 +628,71 @@ class Table(Generic[T], AbstractTable):
         print(f"resolve {cls.__name__} with {fields}")
         return cls.get_model_type().objects.filter(**fields).first()
 
+    @classmethod
+    async def load(cls, __info=None, **fields):
+        # only lookups by primary key can be batched
+        if __info is None or set(fields) != {"id"}:
+            return cls.resolve(None, **fields)
+
+        plan = cls.plan_query(get_selected_fields(__info, cls.get_type_name()))
+        return await get_loader(__info, cls.get_model_type()).load(fields["id"], plan)
+
+    @classmethod
+    async def load_many_with_context(cls, __info, ids: List[int]):
+        """ Load several rows of this table with one query, keeping order of ids """
+
+        plan = cls.plan_query(get_selected_fields(__info, cls.get_type_name()))
+        objs = await get_loader(__info, cls.get_model_type()).load_many(ids, plan)
+
+        for obj in objs:
+            if obj is not None:
+                cls.resolve_children(obj)
+            cls.attach_context(obj, __info)
+
+        return objs
+
+    @classmethod
+    def plan_query(cls, selected) -> QueryPlan:
+        """ Build query plan that loads everything selected fields need in one go """
+
+        meta = cls.get_model_type()._meta
+
+        # both `team` and `team_id` point to the same column
+        columns = {}
+        for field in meta.concrete_fields:
+            columns[field.name] = field.attname
+            columns[field.attname] = field.attname
+
+        computed_props = {name: prop for name, prop, return_type, args in cls.get_custom_resolvers()}
+
+        plan = QueryPlan(only=[meta.pk.attname])
+
+        for name in selected:
+            if name.startswith("__"):
+                continue
+
+            if name in computed_props:
+                plan = plan.merge(getattr(computed_props[name], '_query_hints', QueryPlan(only=None)))
+            elif name in columns:
+                plan = plan.merge(QueryPlan(only=[columns[name]]))
+            else:
+                # property or nested table, no way to know which columns it reads
+                plan = plan.merge(QueryPlan(only=None))
+
+        return plan
+
+    @classmethod
+    def get_dependencies(cls) -> Tuple[Type, ...]:
+        return cls.get_model_type(), *cls.depends_on
+
+    @classmethod
+    def is_affected_by(cls, change: ModelChange, **fields) -> bool:
+        # row subscription only cares about its own row
+        if change.model is cls.get_model_type() and "id" in fields:
+            return change.pk == fields["id"]
+
+        return super().is_affected_by(change, **fields)
+
     @classmethod
     def get_model_type(cls):
         return cls._type_T
@@ -501,8 +758,8 @@ class PaginatedTable(Generic[X], VirtualTable):
         cls.__annotations__['items'].__args__ = [cls._type_T]
 
     def __init__(self, items: List[X], page: int, size: int):
-        self.items = items[page * size: (page + 1) * size]
-        self.count = len(items)
+        # items can be a queryset, then only count and requested page are fetched
+        self.count, self.items, _ = pagination.paginate(items, page, size)
 
 
 Y = TypeVar("Y")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.services.stats import rebuild_player_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute materialized player stats from game events and sessions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("player_ids", nargs="*", type=int, help="Players to rebuild, every player if omitted")
+
+    def handle(self, *args, player_ids=None, **options):
+        count = rebuild_player_stats(player_ids or None)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats of {count} players"))
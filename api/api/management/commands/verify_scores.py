@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Game
+
+
+class Command(BaseCommand):
+    help = "Compare stored game scores with scores counted from rounds"
+
+    def add_arguments(self, parser):
+        parser.add_argument("game_ids", nargs="*", type=int, help="Games to verify, every game if omitted")
+        parser.add_argument("--fix", action="store_true", help="Overwrite stored scores that don't match")
+
+    def handle(self, *args, game_ids=None, fix=False, **options):
+        games = Game.objects.all().order_by("id")
+
+        if game_ids:
+            games = games.filter(id__in=game_ids)
+
+        mismatched = 0
+
+        for game in games.iterator():
+            counted = (game.counted_score_a, game.counted_score_b)
+            stored = (game.score_a, game.score_b)
+
+            if counted == stored:
+                continue
+
+            mismatched += 1
+            self.stdout.write(f"Game {game.id}: stored {stored[0]}-{stored[1]}, counted {counted[0]}-{counted[1]}")
+
+            if fix:
+                game.score_a, game.score_b = counted
+                game.save(update_fields=["score_a", "score_b"])
+
+        style = self.style.SUCCESS if not mismatched else self.style.WARNING
+        self.stdout.write(style(f"{mismatched} games with mismatched score" + (", fixed" if fix and mismatched else "")))
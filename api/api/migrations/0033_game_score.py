@@ -0,0 +1,37 @@
+# Generated by Django 4.0 on 2026-10-18 12:30
+
+from django.db import migrations, models
+from django.db.models import Count, Q, F
+
+
+def fill_scores(apps, schema_editor):
+    Game = apps.get_model('api', 'Game')
+
+    games = Game.objects.annotate(
+        counted_a=Count('rounds', filter=Q(rounds__winner=F('team_a'))),
+        counted_b=Count('rounds', filter=Q(rounds__winner=F('team_b'))),
+    )
+
+    for game in games.iterator():
+        Game.objects.filter(pk=game.pk).update(score_a=game.counted_a, score_b=game.counted_b)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0032_playerstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='score_a',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='score_b',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
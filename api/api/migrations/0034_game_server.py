@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 01:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0033_game_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='server_id',
+            field=models.IntegerField(default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.0 on 2026-10-18 18:00
+
+from django.db import migrations
+from django.db.models import Count, Q, F
+
+
+def fill_player_stats(apps, schema_editor):
+    """ Count stats of players that played before stats were stored, see api.services.stats """
+
+    Player = apps.get_model('api', 'Player')
+    PlayerStats = apps.get_model('api', 'PlayerStats')
+    GamePlayerEvent = apps.get_model('api', 'GamePlayerEvent')
+    PlayerSession = apps.get_model('api', 'PlayerSession')
+
+    rows = {
+        player_id: PlayerStats(player_id=player_id)
+        for player_id in Player.objects.exclude(stats__isnull=False).values_list('id', flat=True)
+    }
+
+    if not rows:
+        return
+
+    events = GamePlayerEvent.objects.filter(player_id__in=rows).values('player_id').annotate(
+        kills=Count('id', filter=Q(event='KILL')),
+        deaths=Count('id', filter=Q(event='DEATH')),
+        assists=Count('id', filter=Q(event='ASSIST')),
+        headshots=Count('id', filter=Q(meta__hs=True)),
+    ).order_by()
+
+    won = Q(roster=F('game__winner'))
+    ranked = Q(game__plugins__contains='RankedPlugin')
+
+    sessions = PlayerSession.objects.filter(player_id__in=rows).values('player_id').annotate(
+        games_played=Count('id'),
+        games_won=Count('id', filter=won),
+        ranked_games_played=Count('id', filter=ranked),
+        ranked_games_won=Count('id', filter=won & ranked),
+    ).order_by()
+
+    for aggregate in [*events, *sessions]:
+        stats = rows[aggregate.pop('player_id')]
+        for name, value in aggregate.items():
+            setattr(stats, name, value)
+
+    PlayerStats.objects.bulk_create(rows.values(), batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_game_server'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_player_stats, migrations.RunPython.noop),
+    ]
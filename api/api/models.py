@@ -8,7 +8,7 @@ from typing import Union, Iterable, Optional, List
 
 from django.conf import settings
 from django.contrib.auth.base_user import BaseUserManager
-from django.db import models
+from django.db import models, transaction
 
 from django.contrib.auth.models import AbstractUser, Permission
 from django.db.models import Q
@@ -308,6 +308,13 @@ class Game(models.Model):
 
     winner = models.ForeignKey(InGameTeam, models.SET_NULL, null=True, related_name="+")
 
+    # Bukkit server game is hosted on, see ServerRegistry
+    server_id = models.IntegerField(null=True, default=None)
+
+    # Rounds won by each team, updated as rounds are recorded
+    score_a = models.IntegerField(default=0)
+    score_b = models.IntegerField(default=0)
+
     # Plugins
     plugins = models.JSONField(default=list)
 
@@ -385,13 +392,38 @@ class Game(models.Model):
         return self.plugins and plugin in self.plugins
 
     @property
-    def score_a(self):
+    def counted_score_a(self):
+        """ Score of team A counted from rounds, used to verify stored score """
         return Round.objects.filter(game=self, winner=self.team_a).count()
 
     @property
-    def score_b(self):
+    def counted_score_b(self):
+        """ Score of team B counted from rounds, used to verify stored score """
         return Round.objects.filter(game=self, winner=self.team_b).count()
 
+    def add_round_win(self, team_id: Optional[int], delta: int = 1):
+        """ Add round won by given in-game team to score of game """
+
+        if team_id == self.team_a_id:
+            field = "score_a"
+        elif team_id == self.team_b_id:
+            field = "score_b"
+        else:
+            return
+
+        # row is locked, so that concurrent rounds can't overwrite each other
+        with transaction.atomic():
+            game = Game.objects.select_for_update().filter(pk=self.pk).first()
+
+            # game is being deleted together with its rounds
+            if game is None:
+                return
+
+            setattr(game, field, getattr(game, field) + delta)
+            game.save(update_fields=[field])
+
+        setattr(self, field, getattr(game, field))
+
 
 class Round(models.Model):
     """
@@ -405,6 +437,15 @@ class Round(models.Model):
     number = models.IntegerField()
     winner = models.ForeignKey(InGameTeam, null=True, on_delete=models.CASCADE)
 
+    def save(self, *args, **kwargs):
+        # score of game is updated by signal, in the same transaction as round itself
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
 
 class PlayerSession(models.Model):
 
@@ -475,6 +516,33 @@ class GamePlayerEvent(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
 
+class PlayerStats(models.Model):
+    """
+        Totals of player events and games, kept up to date as they are recorded,
+        so that reading player stats does not depend on how many games player has.
+        See api.services.stats for how it is updated and rebuilt.
+    """
+
+    player = models.OneToOneField(Player, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+
+    kills = models.IntegerField(default=0)
+    deaths = models.IntegerField(default=0)
+    assists = models.IntegerField(default=0)
+    headshots = models.IntegerField(default=0)
+
+    games_played = models.IntegerField(default=0)
+    games_won = models.IntegerField(default=0)
+    ranked_games_played = models.IntegerField(default=0)
+    ranked_games_won = models.IntegerField(default=0)
+
+    @property
+    def hs(self) -> float:
+        """ Percent of kills that were headshots """
+        if not self.kills:
+            return 0
+        return round(self.headshots / self.kills * 100, 2)
+
+
 class MapPickProcessManager(models.Manager):
 
     def create(self):
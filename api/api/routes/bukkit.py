@@ -1,3 +1,6 @@
+from typing import List
+
+from django.conf import settings
 from fastapi import APIRouter
 
 from api.events.bukkit import BukkitEventManager
@@ -8,12 +11,27 @@ from api.services.minestrike import MineStrike
 router = APIRouter()
 
 
+def get_minestrike(event: AbsEvent) -> MineStrike:
+    return MineStrike.get(event.server_id or settings.BUKKIT_DEFAULT_SERVER)
+
+
 @router.post('/event')
 async def post_event(event: AbsEvent):
-    response = await BukkitEventManager.propagate_abstract_event(event, MineStrike(1))
+    response = await BukkitEventManager.propagate_abstract_event(event, get_minestrike(event))
 
     return {
         "response": {
             "payload": response
         }
     }
+
+
+@router.post('/events')
+async def post_events(events: List[AbsEvent]):
+    """ Events sent by bukkit in a burst, handled in order they are listed """
+
+    responses = await BukkitEventManager.propagate_abstract_events(events, get_minestrike)
+
+    return {
+        "responses": responses
+    }
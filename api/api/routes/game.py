@@ -9,6 +9,7 @@ from api.schemas.common import ApiResponse
 from api.schemas.game import CreateGame, JoinGame
 from api.exceptions import PermissionError, BadRequestError
 from api.services.game import join_game, find_team_for_player
+from api.services.servers import ServerRegistry
 
 router = APIRouter()
 
@@ -22,7 +23,7 @@ def create_game(data: CreateGame, player: Player = PlayerAuthDependency):
     if len(data.match.games) >= data.match.map_count:
         raise BadRequestError('Match already has all games defined')
     
-    return Game.objects.create(match=data.match, map=data.map)
+    return Game.objects.create(match=data.match, map=data.map, server_id=ServerRegistry.pick_server())
 
 
 @router.get('/testcreate')
@@ -4,8 +4,10 @@ from typing import Optional
 
 from api.events.schemas.internal import PlayerLeftGame, PlayerRosterChange, PlayerStatusChange, PlayerJoinGame
 from api.models import Match, InGameTeam, PlayerSession, Game, Player, MatchTeam, Map
+from api.events.event import EventOut
 from api.events.internal import internalHandler
 from api.services.minestrike import MineStrike
+from api.services.servers import ServerRegistry
 
 PLUGIN_MAP = {
     Game.Mode.PUB: ['DefusalPlugin', 'WarmUpPlugin'],
@@ -110,8 +112,11 @@ def team_auto_balance(game: Game) -> bool:
     return False
 
 
-async def leave_active_game(player: Player):
-    """ Make player leave game they are currently are in"""
+async def leave_active_game(player: Player, notify_server: bool = True) -> Optional[EventOut]:
+    """
+        Make player leave game they are currently are in.
+        Returns command that tells Bukkit about it, it is only sent if `notify_server` is set.
+    """
     session = player.get_active_session()
     if not session:
         return
@@ -124,12 +129,16 @@ async def leave_active_game(player: Player):
     # handle internally
     await internalHandler.propagate_event(event=PlayerLeftGame(session=session), sender=session)
 
-    logging.info(f"Propagate game leave to Bukkit...")
-
     # explicitly tell Bukkit that player left
-    await MineStrike(1).leave_game(game=session.game, player=player)
+    minestrike = MineStrike.for_game(session.game)
+    command = minestrike.leave_game_event(game=session.game, player=player)
+
+    if notify_server:
+        logging.info(f"Propagate game leave to Bukkit...")
+        await minestrike.safe_send_event(command)
 
     logging.info(f"Player {player} left game {session.game}")
+    return command
 
 
 async def join_game(game: Game, player: Player, status: int, roster):
@@ -142,11 +151,21 @@ async def join_game(game: Game, player: Player, status: int, roster):
     if status == PlayerSession.Status.SPECTATOR and roster is not None:
         raise ValueError("Player can't spectate and be in a roster")
 
+    minestrike = MineStrike.for_game(game)
+
+    # leave and model update are sent together in one batch once database is updated
+    commands = []
+
     active_game: Optional[Game] = player.get_active_game()
 
     if active_game:
         logging.info(f"Player {player} is currently in game {active_game}")
-        await leave_active_game(player)
+
+        if active_game.server_id == game.server_id:
+            commands.append(await leave_active_game(player, notify_server=False))
+        else:
+            # other server has to be told separately
+            await leave_active_game(player)
 
     # player might have idle session already
     session = PlayerSession.objects.filter(
@@ -196,8 +215,10 @@ async def join_game(game: Game, player: Player, status: int, roster):
     # after it was updated, we can be sure that
     # plugin is aware that player is now member of
     # inGameTeam via new PlayerSession object
-    r = await MineStrike(1).update_game(game)
-    print(f"Response from BUKKIT: {r}")
+    commands.append(minestrike.model_update_event(game))
+
+    responses = await minestrike.send_batch([command for command in commands if command is not None])
+    logging.debug(f"Response from BUKKIT: {responses}")
 
     logging.info(f"Propagating internally")
 
@@ -210,14 +231,15 @@ async def join_game(game: Game, player: Player, status: int, roster):
     logging.info(f"Player {player} joining game {game}...")
 
     # explicitly tell Bukkit that player joined
-    await MineStrike(1).join_game(game=session.game, player=player, team=roster)
+    await minestrike.join_game(game=session.game, player=player, team=roster)
 
     logging.info(f"Player {player} joined game {game}")
 
 
-async def create_game(map: Map, mode: int):
+async def create_game(map: Map, mode: int, server_id: int = None):
     """
         Create game with given map and mode.
+        Game is placed on given server, or on the least loaded one.
     """
     team_a = InGameTeam.objects.create(starts_as_ct=True, is_ct=True)
     team_b = InGameTeam.objects.create(starts_as_ct=False, is_ct=False)
@@ -229,6 +251,7 @@ async def create_game(map: Map, mode: int):
         status=Game.Status.NOT_STARTED,
         team_a=team_a,
         team_b=team_b,
+        server_id=server_id or ServerRegistry.pick_server(),
     )
 
     return game
@@ -249,7 +272,8 @@ async def create_pub(map_name=None):
         team_b=team_b,
         status=Game.Status.NOT_STARTED,
         plugins=PLUGIN_MAP[Game.Mode.PUB],
-        map=map_name
+        map=map_name,
+        server_id=ServerRegistry.pick_server(),
     )
 
     return game
@@ -270,7 +294,8 @@ async def create_deathmatch(map_name=None):
         team_b=team_b,
         status=Game.Status.NOT_STARTED,
         plugins=PLUGIN_MAP[Game.Mode.DEATHMATCH],
-        map=map_name
+        map=map_name,
+        server_id=ServerRegistry.pick_server(),
     )
 
     return game
@@ -291,7 +316,8 @@ async def create_duels(map_name=None):
         team_b=team_b,
         status=Game.Status.NOT_STARTED,
         plugins=PLUGIN_MAP[Game.Mode.DUELS],
-        map=map_name
+        map=map_name,
+        server_id=ServerRegistry.pick_server(),
     )
 
 
@@ -0,0 +1,121 @@
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Sequence
+from typing import Dict, List, Optional, Tuple, Type
+
+from django.db.models import Model
+
+from api.models import Player, Team
+
+
+class Leaderboard:
+    """
+        Rows of a model ordered by score, highest first, kept in memory.
+
+        Rows are stored as a sorted list of (-score, id) keys, so rank of a row
+        is found with binary search and any page is a slice of that list.
+        It is loaded from database on first use and then updated on every save.
+    """
+
+    def __init__(self, model: Type[Model], field: str = "elo"):
+        self.model = model
+        self.field = field
+
+        self._keys: Optional[List[Tuple[int, int]]] = None
+        self._scores: Dict[int, int] = {}
+
+    def load(self):
+        rows = self.model.objects.values_list("id", self.field)
+
+        self._scores = {pk: score for pk, score in rows}
+        self._keys = sorted((-score, pk) for pk, score in self._scores.items())
+
+    def get_keys(self) -> List[Tuple[int, int]]:
+        if self._keys is None:
+            self.load()
+
+        return self._keys
+
+    def update(self, pk: int, score: int):
+        """ Move row to its new place. Does nothing until leaderboard is loaded. """
+
+        if self._keys is None or self._scores.get(pk) == score:
+            return
+
+        self.remove(pk)
+        self._scores[pk] = score
+        insort(self._keys, (-score, pk))
+
+    def remove(self, pk: int):
+        if self._keys is None or pk not in self._scores:
+            return
+
+        key = (-self._scores.pop(pk), pk)
+        del self._keys[bisect_left(self._keys, key)]
+
+    def rank(self, pk: int) -> Optional[int]:
+        """ Position of row starting from 1. Rows with same score share rank. """
+
+        keys = self.get_keys()
+
+        if pk not in self._scores:
+            return None
+
+        # number of rows with strictly higher score
+        return bisect_left(keys, (-self._scores[pk],)) + 1
+
+    def ids(self, descending: bool = True) -> "LeaderboardIds":
+        return LeaderboardIds(self.get_keys(), descending)
+
+    def __len__(self):
+        return len(self.get_keys())
+
+
+class LeaderboardIds(Sequence):
+    """ Ids of leaderboard rows in order, pages are sliced without copying whole leaderboard """
+
+    def __init__(self, keys: List[Tuple[int, int]], descending: bool):
+        self.keys = keys
+        self.descending = descending
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+
+        if not self.descending:
+            item = len(self.keys) - 1 - item if item >= 0 else -1 - item
+
+        return self.keys[item][1]
+
+    def seek(self, values: Optional[list], size: int) -> List[Tuple[int, int, int]]:
+        """
+            Up to `size` rows that come after row with given (score, id), from the start if None.
+            Rows are (id, score, id), so that the last one can be used as next cursor.
+        """
+
+        if values is None:
+            start = 0 if self.descending else len(self.keys)
+        else:
+            if len(values) != 2:
+                raise ValueError("Cursor does not match ordering of this list")
+
+            score, pk = values
+            key = (-score, pk)
+            start = bisect_right(self.keys, key) if self.descending else bisect_left(self.keys, key)
+
+        if self.descending:
+            keys = self.keys[start:start + size]
+        else:
+            keys = self.keys[max(start - size, 0):start][::-1]
+
+        return [(pk, -score, pk) for score, pk in keys]
+
+
+players = Leaderboard(Player)
+teams = Leaderboard(Team)
+
+
+def get_leaderboard(model: Type[Model]) -> Optional[Leaderboard]:
+    return {Player: players, Team: teams}.get(model)
@@ -1,8 +1,96 @@
+import asyncio
+import contextlib
+import fcntl
+import json
 import logging
-from typing import Optional, Dict
+import os
+import time
+from collections import deque
+from typing import Optional, Dict, Deque, List
+
+from django.conf import settings
 
 from api.consumers import WsPool, WsConn
+from api.events.bus import EventBus
 from api.events.event import EventOut
+from api.services.servers import ServerRegistry
+
+# extra seconds to wait for a worker bukkit is connected to, on top of command timeout
+BUS_RESPONSE_MARGIN = 1
+
+
+class InFlightLimit:
+    """ Limits number of commands waiting for confirmation, batch counts as every command it carries """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.count = 0
+        self._changed = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def hold(self, evt: EventOut):
+        # batch larger than limit is sent once nothing else is in flight
+        weight = min(len((evt.payload or {}).get("events") or []) or 1, self.limit)
+
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.count + weight <= self.limit)
+            self.count += weight
+
+        try:
+            yield
+        finally:
+            async with self._changed:
+                self.count -= weight
+                self._changed.notify_all()
+
+
+class JournalSlot:
+    """
+        Directory of this process inside BUKKIT_JOURNAL_DIR. Workers take numbered slots
+        and hold lock of their slot while running, so every journal has a single writer.
+        Worker started after restart takes a free slot and restores journals left in it.
+    """
+
+    _path: Optional[str] = None
+    _pid: Optional[int] = None
+    _lock_file = None
+
+    @classmethod
+    def get_path(cls) -> str:
+        # lock is not ours in a process forked after slot was taken
+        if cls._path is None or cls._pid != os.getpid():
+            cls._take_slot()
+
+        return cls._path
+
+    @classmethod
+    def _take_slot(cls):
+        os.makedirs(settings.BUKKIT_JOURNAL_DIR, exist_ok=True)
+        slot = 0
+
+        while True:
+            lock_file = open(os.path.join(settings.BUKKIT_JOURNAL_DIR, f"worker-{slot}.lock"), "w")
+
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                slot += 1
+                continue
+
+            cls._lock_file = lock_file
+            cls._pid = os.getpid()
+            cls._path = os.path.join(settings.BUKKIT_JOURNAL_DIR, f"worker-{slot}")
+            return
+
+
+def is_delivered(conn: WsConn, evt: EventOut, response: Optional[Dict]) -> bool:
+    """ Event that needs confirmation is delivered once it is confirmed, other events once they are sent """
+
+    if evt.needs_confirm:
+        return response is not None
+
+    return not conn.closed
 
 
 class MineStrike:
@@ -10,30 +98,190 @@ class MineStrike:
         Wrapper on top of WebsocketConnection to provide a
         simplified interface as a way to communicate with
         remote Bukkit plugin.
+
+        There is one long-lived instance per server, see MineStrike.get.
+        Commands sent while server is offline on every worker are queued by the worker
+        that sent them, and sent in order once server connects to any worker.
+        If BUKKIT_JOURNAL_DIR is set, queue is also kept on disk to survive restart of API.
     """
 
+    _links: Dict[int, "MineStrike"] = {}
+
+    @classmethod
+    def get(cls, server_id) -> "MineStrike":
+        link = cls._links.get(server_id)
+
+        if link is None:
+            link = cls._links[server_id] = cls(server_id)
+
+        return link
+
+    @classmethod
+    def for_game(cls, game) -> "MineStrike":
+        """ Link to the server that hosts game """
+        return cls.get(game.server_id or settings.BUKKIT_DEFAULT_SERVER)
+
     def __init__(self, server_id):
         self.server_id = server_id
 
-        self.event_queue = []
+        self.event_queue: Deque[EventOut] = deque()
+        self._draining = False
 
-        @WsPool.on_bukkit_connect(self.server_id)
-        async def send_queued_events():
-            while self.event_queue:
-                await self.safe_send_event(self.event_queue.pop(0))
+        # limits number of commands waiting for confirmation at once, created in event loop
+        self._in_flight: Optional[InFlightLimit] = None
+
+        self.journal_path = None
+
+        if settings.BUKKIT_JOURNAL_DIR:
+            self.journal_path = os.path.join(JournalSlot.get_path(), f"bukkit-{server_id}.jsonl")
+            self._load_journal()
 
     def get_conn(self) -> WsConn:
         return WsPool.get_bukkit_server(self.server_id)
 
-    async def safe_send_event(self, evt) -> Optional[Dict]:
-        if self.get_conn() is None:
-            self.event_queue.append(evt)
-            logging.warning(f"Event {evt.type} queued, no coroutine returned")
+    def _load_journal(self):
+        if not os.path.exists(self.journal_path):
             return
 
-        return await self.get_conn().send_event(evt)
+        with open(self.journal_path) as journal:
+            for line in journal:
+                if line.strip():
+                    self.event_queue.append(EventOut.from_dict(json.loads(line)))
 
-    async def model_update(self, model, pk=None):
+        if self.event_queue:
+            logging.info(f"Restored {len(self.event_queue)} queued events of server {self.server_id}")
+
+    def _write_journal(self):
+        """ Replace journal with what is left in queue """
+
+        if self.journal_path is None:
+            return
+
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        tmp_path = self.journal_path + ".tmp"
+
+        with open(tmp_path, "w") as journal:
+            for evt in self.event_queue:
+                journal.write(json.dumps(evt.dict()) + "\n")
+
+        os.replace(tmp_path, self.journal_path)
+
+    def queue_event(self, evt: EventOut):
+        # whoever waited for it is gone, queued command gets new deadline once it is sent
+        evt.payload = {key: value for key, value in (evt.payload or {}).items() if key != "deadline"}
+        evt.clear_encoded()
+
+        self.event_queue.append(evt)
+
+        if self.journal_path is not None:
+            os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+
+            with open(self.journal_path, "a") as journal:
+                journal.write(json.dumps(evt.dict()) + "\n")
+
+        logging.warning(f"Event {evt.type} queued, {len(self.event_queue)} events wait for server {self.server_id}")
+
+    async def drain_queue(self):
+        """ Send queued events in order they were queued """
+
+        if self._draining:
+            return
+
+        self._draining = True
+
+        try:
+            while self.event_queue:
+                delivered, _ = await self._send(self.event_queue[0], settings.BUKKIT_COMMAND_TIMEOUT)
+
+                # server went offline before event was confirmed, send it again after reconnect
+                if not delivered:
+                    return
+
+                self.event_queue.popleft()
+                self._write_journal()
+        finally:
+            self._draining = False
+
+    async def safe_send_event(self, evt, timeout: float = None) -> Optional[Dict]:
+        """
+            Send command and wait for its response at most `timeout` seconds.
+            Deadline is sent along, so that server can skip command nobody waits for anymore.
+        """
+
+        timeout = timeout or settings.BUKKIT_COMMAND_TIMEOUT
+
+        # events queued earlier go first
+        if not self.event_queue:
+            delivered, response = await self._send(evt, timeout)
+
+            if delivered:
+                return response
+
+        self.queue_event(evt)
+        asyncio.create_task(self.drain_queue())
+
+    async def _send(self, evt: EventOut, timeout: float):
+        """ Send command with deadline once there is room for it among commands in flight """
+
+        if self._in_flight is None:
+            self._in_flight = InFlightLimit(settings.BUKKIT_MAX_IN_FLIGHT)
+
+        async with self._in_flight.hold(evt):
+            evt.payload = {**(evt.payload or {}), "deadline": time.time() + timeout}
+            evt.clear_encoded()
+            return await self._deliver(evt, timeout)
+
+    async def _deliver(self, evt: EventOut, timeout: float = None):
+        """
+            Send command to server, either directly or through the worker server is connected to.
+            Returns whether some worker sent it, and response of server.
+        """
+
+        conn = self.get_conn()
+
+        if conn is not None:
+            response = await conn.send_event(evt, timeout)
+
+            # connection dropped or server didn't confirm event in time
+            return is_delivered(conn, evt, response), response
+
+        if not EventBus.is_distributed() or not ServerRegistry.is_online(self.server_id):
+            return False, None
+
+        timeout = timeout or settings.WS_RESPONSE_TIMEOUT
+        result = await EventBus.request(
+            EventBus.BUKKIT_COMMANDS,
+            {"server_id": self.server_id, "event": evt.dict(), "timeout": timeout},
+            timeout + BUS_RESPONSE_MARGIN,
+        )
+
+        # nobody has server connected anymore
+        if result is None:
+            return False, None
+
+        return result["delivered"], result["response"]
+
+    async def send_batch(self, events: List[EventOut], timeout: float = None) -> List[Optional[Dict]]:
+        """
+            Send several commands in one envelope, they are run in order and confirmed together.
+            Returns response of every command, None for every command if batch was not confirmed.
+        """
+
+        if not events:
+            return []
+
+        batch = EventOut(
+            type=EventOut.Type.BATCH,
+            payload={"events": [evt.dict() for evt in events]},
+            delivery=EventOut.Delivery.CONFIRM,
+        )
+
+        response = await self.safe_send_event(batch, timeout) or {}
+        responses = response.get("responses") or []
+
+        return [*responses, *[None] * (len(events) - len(responses))][:len(events)]
+
+    def model_update_event(self, model, pk=None) -> EventOut:
 
         if isinstance(model, str):
             model_name = model
@@ -43,15 +291,17 @@ class MineStrike:
             model_name = string[0].lower() + string[1:]
             model_pk = model.pk
 
-        evt = EventOut(
+        return EventOut(
             type=EventOut.Type.MODEL_UPDATE,
             payload={
                 "model_name": model_name,
                 "model_pk": model_pk,
-            }
+            },
+            delivery=EventOut.Delivery.CONFIRM,
         )
 
-        return await self.safe_send_event(evt)
+    async def model_update(self, model, pk=None):
+        return await self.safe_send_event(self.model_update_event(model, pk))
 
     async def update_server(self):
         """
@@ -60,29 +310,33 @@ class MineStrike:
         """
         await self.model_update("server", self.server_id)
 
-    async def join_game(self, game, player, team):
-
-        evt = EventOut(
+    def join_game_event(self, game, player, team) -> EventOut:
+        return EventOut(
             type="PlayerGameConnectEvent",
             payload={
                 "player_id": player.id,
                 "game_id": game.id,
                 "team_id": team.id,
                 "is_spectating": False,
-            }
+            },
+            delivery=EventOut.Delivery.CONFIRM,
         )
 
-        return await self.safe_send_event(evt)
+    async def join_game(self, game, player, team):
+        return await self.safe_send_event(self.join_game_event(game, player, team))
 
-    async def leave_game(self, game, player):
-        evt = EventOut(
+    def leave_game_event(self, game, player) -> EventOut:
+        return EventOut(
             type="PlayerLeaveGameBackendEvent",
             payload={
                "player_id": player.id,
                "game_id": game.id,
-            }
+            },
+            delivery=EventOut.Delivery.CONFIRM,
         )
-        await self.safe_send_event(evt)
+
+    async def leave_game(self, game, player):
+        await self.safe_send_event(self.leave_game_event(game, player))
 
     async def update_team(self, in_game_team):
         return await self.model_update(in_game_team)
@@ -90,3 +344,35 @@ class MineStrike:
     async def update_game(self, game):
         return await self.model_update(game)
 
+
+async def run_command(message: dict):
+    conn = WsPool.get_bukkit_server(message["server_id"])
+
+    if conn is None:
+        return
+
+    evt = EventOut.from_dict(message["event"])
+    response = await conn.send_event(evt, message.get("timeout"))
+    await EventBus.respond(message, {"delivered": is_delivered(conn, evt, response), "response": response})
+
+
+@EventBus.on(EventBus.BUKKIT_COMMANDS)
+def remote_command(message: dict):
+    """ Command published by a worker that bukkit is not connected to """
+
+    # waiting for confirmation must not hold up other commands
+    asyncio.create_task(run_command(message))
+
+
+@EventBus.on(EventBus.BUKKIT_SERVERS)
+def send_queued_events(message: dict):
+    """ Server connected to some worker, send commands this worker queued for it """
+
+    if not message.get("online"):
+        return
+
+    # link is created if this worker has none yet, that restores its journal
+    link = MineStrike.get(message["server_id"])
+
+    if link.event_queue:
+        asyncio.create_task(link.drain_queue())
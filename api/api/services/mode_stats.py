@@ -0,0 +1,54 @@
+from typing import Dict, Optional
+
+from django.db.models import Count, Q
+
+from api.models import Game, PlayerSession
+
+
+class ModeStats:
+    """ Online players and open games of one game mode """
+
+    def __init__(self, online: int = 0, games: int = 0):
+        self.online = online
+        self.games = games
+
+    def __repr__(self):
+        return f"<ModeStats online={self.online} games={self.games}>"
+
+
+class ModeStatsSnapshot:
+    """
+        Stats of every game mode, computed with a single grouped query and kept in memory.
+        Snapshot is marked stale whenever a game or a session changes and is recomputed
+        on the next read, so a burst of changes costs one query.
+    """
+
+    _stats: Optional[Dict[int, ModeStats]] = None
+
+    @classmethod
+    def invalidate(cls):
+        cls._stats = None
+
+    @classmethod
+    def refresh(cls) -> Dict[int, ModeStats]:
+        online = Q(
+            sessions__status=PlayerSession.Status.PARTICIPATING,
+            sessions__state=PlayerSession.State.IN_GAME,
+        )
+
+        rows = Game.objects.values('mode').annotate(
+            online=Count('sessions', filter=online),
+            games=Count('id', filter=~Q(status=Game.Status.FINISHED), distinct=True),
+        ).order_by()
+
+        cls._stats = {row['mode']: ModeStats(row['online'], row['games']) for row in rows}
+        return cls._stats
+
+    @classmethod
+    def get(cls, mode: int) -> ModeStats:
+        stats = cls._stats
+
+        if stats is None:
+            stats = cls.refresh()
+
+        return stats.get(mode) or ModeStats()
@@ -0,0 +1,101 @@
+import time
+from typing import Dict, List
+
+from django.conf import settings
+from django.db.models import Count
+
+from api.consumers import WsPool
+from api.events.bus import EventBus
+from api.models import Game
+
+# number of missed heartbeats after which server is considered offline
+MISSED_HEARTBEATS = 3
+
+
+class ServerInfo:
+    """ Bukkit server that is online """
+
+    def __init__(self, server_id: int, capacity: int):
+        self.server_id = server_id
+        self.capacity = capacity
+        self.seen_at = time.monotonic()
+
+    def is_alive(self) -> bool:
+        return time.monotonic() - self.seen_at < settings.BUKKIT_SERVER_HEARTBEAT * MISSED_HEARTBEATS
+
+    def __repr__(self):
+        return f"<ServerInfo {self.server_id} capacity={self.capacity}>"
+
+
+class ServerRegistry:
+    """
+        Bukkit servers that are online, known to every API worker no matter
+        which one server is connected to. New games are placed on the server
+        that uses the smallest share of its capacity.
+
+        Workers announce their servers on start of every other worker and then
+        every BUKKIT_SERVER_HEARTBEAT seconds, servers of a worker that stopped
+        announcing them are forgotten.
+    """
+
+    _servers: Dict[int, ServerInfo] = {}
+
+    @classmethod
+    async def query(cls):
+        """ Ask other workers to announce their servers, used by worker that just started """
+        await EventBus.publish(EventBus.BUKKIT_SERVERS, {"query": True})
+
+    @classmethod
+    def get_servers(cls) -> List[ServerInfo]:
+        for server in list(cls._servers.values()):
+            if not server.is_alive():
+                cls._servers.pop(server.server_id, None)
+
+        return list(cls._servers.values())
+
+    @classmethod
+    def is_online(cls, server_id: int) -> bool:
+        return any(server.server_id == server_id for server in cls.get_servers())
+
+    @classmethod
+    def get_loads(cls) -> Dict[int, int]:
+        """ Number of unfinished games of every online server, counted with a single grouped query """
+
+        rows = Game.objects.filter(server_id__in=[server.server_id for server in cls.get_servers()]).exclude(
+            status=Game.Status.FINISHED,
+        ).values('server_id').annotate(games=Count('id')).order_by()
+
+        return {row['server_id']: row['games'] for row in rows}
+
+    @classmethod
+    def pick_server(cls) -> int:
+        """
+            Server for a new game. Load is read without locking, so games created
+            at the same time can all go to one server and take it past its capacity,
+            capacity is a soft limit.
+        """
+
+        loads = cls.get_loads()
+
+        servers = [server for server in cls.get_servers() if loads.get(server.server_id, 0) < server.capacity]
+
+        if not servers:
+            # nothing is online or everything is full, commands wait in queue of default server
+            return settings.BUKKIT_DEFAULT_SERVER
+
+        least_loaded = min(servers, key=lambda server: (loads.get(server.server_id, 0) / server.capacity, server.server_id))
+        return least_loaded.server_id
+
+
+@EventBus.on(EventBus.BUKKIT_SERVERS)
+def server_status(message: dict):
+    if message.get("query"):
+        WsPool.announce_bukkit_servers()
+        return
+
+    server_id = message["server_id"]
+
+    if message["online"]:
+        ServerRegistry._servers[server_id] = ServerInfo(server_id, message["capacity"])
+    else:
+        ServerRegistry._servers.pop(server_id, None)
@@ -0,0 +1,184 @@
+from typing import Optional, Iterable, List
+
+from django.db import transaction
+from django.db.models import Count, Q, F
+
+from api.models import PlayerStats, GamePlayerEvent, PlayerSession, Game, Player
+
+RANKED_PLUGIN = "RankedPlugin"
+
+# sessions of games played with ranked plugin
+RANKED_SESSIONS = Q(game__plugins__contains=RANKED_PLUGIN)
+
+EVENT_FIELDS = {
+    GamePlayerEvent.Type.KILL: "kills",
+    GamePlayerEvent.Type.DEATH: "deaths",
+    GamePlayerEvent.Type.ASSIST: "assists",
+}
+
+
+def get_player_stats(player_id: Optional[int]) -> PlayerStats:
+    """
+        Get stats of player with a single primary key lookup. Reads never write,
+        player that was never counted gets zeroes until `rebuild_player_stats` command is run
+        or until the first event of that player backfills the row.
+    """
+
+    if player_id is None:
+        return PlayerStats()
+
+    return PlayerStats.objects.filter(player_id=player_id).first() or PlayerStats(player_id=player_id)
+
+
+def add_to_stats(player_id: int, create: bool = True, **deltas):
+    """
+        Add deltas to counters of player stats.
+        Missing row is built from scratch if `create` is set, it already includes the change.
+    """
+
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        # waits for rebuild of this player, so that change is applied to rebuilt row
+        lock_players([player_id])
+
+        stats = PlayerStats.objects.filter(player_id=player_id).first()
+
+        if stats is None:
+            if create:
+                rebuild_player_stats([player_id])
+            return
+
+        for name, delta in deltas.items():
+            setattr(stats, name, F(name) + delta)
+
+        stats.save(update_fields=list(deltas))
+
+
+def lock_players(player_ids: Iterable[int] = None):
+    """ Lock player rows until end of transaction, stats of these players are changed one at a time """
+
+    players = Player.objects.select_for_update().order_by("id")
+
+    if player_ids is not None:
+        players = players.filter(id__in=player_ids)
+
+    list(players.values_list("id", flat=True))
+
+
+def record_player_event(event: GamePlayerEvent, sign: int = 1):
+    """ Count event that was recorded (sign=1) or removed (sign=-1) """
+
+    deltas = {}
+
+    field = EVENT_FIELDS.get(event.event)
+    if field:
+        deltas[field] = sign
+
+    if (event.meta or {}).get("hs") is True:
+        deltas["headshots"] = sign
+
+    add_to_stats(event.player_id, create=sign > 0, **deltas)
+
+
+def record_session(session: PlayerSession, sign: int = 1):
+    """ Count game session that was created (sign=1) or removed (sign=-1) """
+
+    # game can already be gone if session is deleted together with it
+    game = Game.objects.filter(pk=session.game_id).first()
+    ranked = bool(game and game.has_plugin(RANKED_PLUGIN))
+    won = bool(game and game.winner_id is not None and session.roster_id == game.winner_id)
+
+    add_to_stats(
+        session.player_id,
+        create=sign > 0,
+        games_played=sign,
+        games_won=sign if won else 0,
+        ranked_games_played=sign if ranked else 0,
+        ranked_games_won=sign if ranked and won else 0,
+    )
+
+
+def record_game_winner(game: Game, previous_winner_id: Optional[int]):
+    """ Move won games from players of previous winner to players of current one """
+
+    if game.winner_id == previous_winner_id:
+        return
+
+    ranked = bool(game.has_plugin(RANKED_PLUGIN))
+
+    for winner_id, sign in ((previous_winner_id, -1), (game.winner_id, 1)):
+        if winner_id is None:
+            continue
+
+        player_ids = PlayerSession.objects.filter(game=game, roster_id=winner_id).values_list("player_id", flat=True)
+
+        for player_id in player_ids:
+            add_to_stats(
+                player_id,
+                games_won=sign,
+                ranked_games_won=sign if ranked else 0,
+            )
+
+
+def rebuild_player_stats(player_ids: Iterable[int] = None) -> int:
+    """
+        Recompute stats of given players, or of every player, from events and sessions.
+        Returns number of rows written.
+
+        Everything happens in one transaction that holds locks of players,
+        changes counted by add_to_stats wait for it and are applied on top.
+    """
+
+    with transaction.atomic():
+        if player_ids is not None:
+            player_ids = list(player_ids)
+
+        lock_players(player_ids)
+        return _rebuild_player_stats(player_ids)
+
+
+def _rebuild_player_stats(player_ids: Optional[List[int]]) -> int:
+
+    players = Player.objects.all()
+    events = GamePlayerEvent.objects.all()
+    sessions = PlayerSession.objects.all()
+    existing = PlayerStats.objects.all()
+
+    if player_ids is not None:
+        players = players.filter(id__in=player_ids)
+        events = events.filter(player_id__in=player_ids)
+        sessions = sessions.filter(player_id__in=player_ids)
+        existing = existing.filter(player_id__in=player_ids)
+
+    rows = {player_id: PlayerStats(player_id=player_id) for player_id in players.values_list("id", flat=True)}
+
+    events = events.values("player_id").annotate(
+        kills=Count("id", filter=Q(event=GamePlayerEvent.Type.KILL)),
+        deaths=Count("id", filter=Q(event=GamePlayerEvent.Type.DEATH)),
+        assists=Count("id", filter=Q(event=GamePlayerEvent.Type.ASSIST)),
+        headshots=Count("id", filter=Q(meta__hs=True)),
+    ).order_by()
+
+    won = Q(roster=F("game__winner"))
+    ranked = RANKED_SESSIONS
+
+    sessions = sessions.values("player_id").annotate(
+        games_played=Count("id"),
+        games_won=Count("id", filter=won),
+        ranked_games_played=Count("id", filter=ranked),
+        ranked_games_won=Count("id", filter=won & ranked),
+    ).order_by()
+
+    for aggregate in [*events, *sessions]:
+        stats = rows[aggregate.pop("player_id")]
+        for name, value in aggregate.items():
+            setattr(stats, name, value)
+
+    existing.delete()
+    PlayerStats.objects.bulk_create(rows.values(), batch_size=1000)
+
+    return len(rows)
@@ -1,13 +1,30 @@
-import asyncio
-
 from asgiref.sync import sync_to_async, async_to_sync
-from django.db.models.signals import post_save, pre_delete
+from django.apps import apps
+from django.db import transaction
+from django.db.models import DEFERRED
+from django.db.models.signals import post_save, pre_delete, post_delete, post_init, pre_save
 from django.dispatch import Signal, receiver
 
-from api.models import Event, Match, Game, Player, Team, MapPick, MapPickProcess, PlayerQueue, MatchTeam, InGameTeam
+from api.models import Event, Match, Game, Player, Team, MapPick, MapPickProcess, PlayerQueue, MatchTeam, InGameTeam, \
+    GamePlayerEvent, PlayerSession, Round
 
 from django.db.models.signals import m2m_changed
 
+from api.graphql.cache import model_changed, response_cache, invalidate_on_commit
+from api.graphql.subscription import ModelChanges
+from api.events.debounce import ModelEventDebouncer
+from api.events.bus import EventBus
+from api.services import stats
+from api.services.mode_stats import ModeStatsSnapshot
+from api.services.leaderboard import get_leaderboard
+
+
+# fields that are sent to clients as a delta, no other field of these models depends on them.
+# saving any other field makes clients fetch the model again, so computed fields stay fresh
+DELTA_FIELDS = {
+    Game: {"score_a", "score_b"},
+}
+
 
 def m2m_change_hook(sender, action, instance, **kwargs):
     table_changed(False, False, instance)
@@ -16,21 +33,216 @@ def m2m_change_hook(sender, action, instance, **kwargs):
 def register_sync_var(model):
 
     receiver(post_save, sender=model)(
-        lambda sender, instance, created, **kwargs: table_changed(created, False, instance)
+        lambda sender, instance, created, update_fields=None, **kwargs: table_changed(created, False, instance, update_fields)
     )
     receiver(pre_delete, sender=model)(
         lambda sender, instance, **kwargs: table_changed(False, True, instance)
     )
 
 
-def table_changed(created, deleted, instance):
-    """ Send events to all subscribed websockets """
+def get_field_values(instance, names):
+    """ Values of saved fields the way they are exposed to clients, None if some can't be sent """
+
+    values = {}
+
+    for name in names:
+        field = instance._meta.get_field(name)
+        value = getattr(instance, field.attname)
+
+        if value is not None and not isinstance(value, (int, float, str, bool)):
+            return None
+
+        values[field.attname] = value
+
+    return values
 
-    from api.consumers import WsPool
+
+def table_changed(created, deleted, instance, update_fields=None):
+    """ Send events to all subscribed websockets.
+        If only some fields were saved, their new values are sent along,
+        so that clients can apply them without fetching the model again.
+        Events are sent after commit, one per changed row, see ModelEventDebouncer. """
 
     event = "create" if created else ('delete' if deleted else 'update')
     print(f"send event: {event} on  {instance}")
-    asyncio.create_task(WsPool.model_event(event=event, instance=instance))
+
+    fields = None
+    if update_fields and not created and not deleted and set(update_fields) <= DELTA_FIELDS.get(type(instance), set()):
+        fields = get_field_values(instance, update_fields)
+
+    ModelEventDebouncer.add(event, instance, fields)
+
+
+def publish_change(model, pk, action):
+    """ Tell other workers to forget what they keep in memory about changed row """
+
+    if not EventBus.is_distributed():
+        return
+
+    message = {"model": model._meta.label, "pk": pk, "action": action}
+    transaction.on_commit(lambda: EventBus.publish_threadsafe(EventBus.MODEL_CHANGES, message))
+
+
+def remote_change_hook(message):
+    """ Row was changed by another worker """
+
+    if message["worker_id"] == EventBus.worker_id:
+        return
+
+    model = apps.get_model(message["model"])
+    pk, action = message["pk"], message["action"]
+
+    response_cache.invalidate(model, None if action == "create" else pk)
+    ModelChanges.publish(model, pk, action)
+
+    if model in (Game, PlayerSession):
+        ModeStatsSnapshot.invalidate()
+
+    leaderboard = get_leaderboard(model)
+
+    if leaderboard is not None:
+        if action == "delete":
+            leaderboard.remove(pk)
+        else:
+            score = model.objects.filter(pk=pk).values_list(leaderboard.field, flat=True).first()
+            if score is not None:
+                leaderboard.update(pk, score)
+
+
+def graphql_save_hook(sender, instance, created=False, **kwargs):
+    model_changed(instance, created)
+    ModelChanges.publish(type(instance), instance.pk, "create" if created else "update")
+    publish_change(type(instance), instance.pk, "create" if created else "update")
+
+
+def graphql_delete_hook(sender, instance, **kwargs):
+    model_changed(instance)
+    ModelChanges.publish(type(instance), instance.pk, "delete")
+    publish_change(type(instance), instance.pk, "delete")
+
+
+def graphql_m2m_hook(sender, action, instance, **kwargs):
+    if not action.startswith("post_"):
+        return
+
+    invalidate_on_commit(sender)
+    model_changed(instance)
+    ModelChanges.publish(sender, None, "update")
+    ModelChanges.publish(type(instance), instance.pk, "update")
+    publish_change(sender, None, "update")
+    publish_change(type(instance), instance.pk, "update")
+
+
+def register_graphql_signals():
+    """ Drop cached GraphQL responses and push new values to GraphQL subscriptions
+        whenever data changes. Unlike websocket events, this is needed for every model,
+        not only synced ones. """
+
+    post_save.connect(graphql_save_hook)
+    post_delete.connect(graphql_delete_hook)
+    m2m_changed.connect(graphql_m2m_hook)
+
+    EventBus.on(EventBus.MODEL_CHANGES)(remote_change_hook)
+
+
+def stats_event_hook(sender, instance, created=False, **kwargs):
+    if created:
+        stats.record_player_event(instance)
+
+
+def stats_event_delete_hook(sender, instance, **kwargs):
+    stats.record_player_event(instance, sign=-1)
+
+
+def stats_session_hook(sender, instance, created=False, **kwargs):
+    if created:
+        stats.record_session(instance)
+
+
+def stats_session_delete_hook(sender, instance, **kwargs):
+    stats.record_session(instance, sign=-1)
+
+
+def game_init_hook(sender, instance, **kwargs):
+    # remember winner game was loaded with, to notice when result is recorded.
+    # winner could be deferred, then it is looked up right before save
+    instance._loaded_winner_id = instance.__dict__.get('winner_id', DEFERRED)
+
+
+def game_pre_save_hook(sender, instance, **kwargs):
+    if instance._loaded_winner_id is DEFERRED:
+        instance._loaded_winner_id = Game.objects.filter(pk=instance.pk).values_list('winner_id', flat=True).first()
+
+
+def game_result_hook(sender, instance, created=False, **kwargs):
+    previous = None if created else instance._loaded_winner_id
+    stats.record_game_winner(instance, previous)
+    instance._loaded_winner_id = instance.winner_id
+
+
+def mode_stats_hook(sender, **kwargs):
+    ModeStatsSnapshot.invalidate()
+
+
+def leaderboard_hook(sender, instance, **kwargs):
+    # elo can be deferred, then it was not changed either
+    elo = instance.__dict__.get('elo')
+    if elo is not None:
+        get_leaderboard(sender).update(instance.pk, elo)
+
+
+def leaderboard_delete_hook(sender, instance, **kwargs):
+    get_leaderboard(sender).remove(instance.pk)
+
+
+def round_pre_save_hook(sender, instance, **kwargs):
+    # row is locked, so that concurrent changes of winner move the point only once
+    instance._previous_winner_id = None if instance._state.adding else \
+        Round.objects.select_for_update().filter(pk=instance.pk).values_list('winner_id', flat=True).first()
+
+
+def round_hook(sender, instance, created=False, **kwargs):
+    previous = None if created else instance._previous_winner_id
+
+    if previous == instance.winner_id:
+        return
+
+    game = Game.objects.filter(pk=instance.game_id).first()
+    if game:
+        game.add_round_win(previous, -1)
+        game.add_round_win(instance.winner_id)
+
+
+def round_delete_hook(sender, instance, **kwargs):
+    game = Game.objects.filter(pk=instance.game_id).first()
+    if game:
+        game.add_round_win(instance.winner_id, -1)
+
+
+def register_stats_signals():
+    """ Keep materialized stats, scores and leaderboards up to date as data is recorded """
+
+    post_save.connect(stats_event_hook, sender=GamePlayerEvent)
+    post_delete.connect(stats_event_delete_hook, sender=GamePlayerEvent)
+
+    post_save.connect(stats_session_hook, sender=PlayerSession)
+    post_delete.connect(stats_session_delete_hook, sender=PlayerSession)
+
+    post_init.connect(game_init_hook, sender=Game)
+    pre_save.connect(game_pre_save_hook, sender=Game)
+    post_save.connect(game_result_hook, sender=Game)
+
+    for model in (Game, PlayerSession):
+        post_save.connect(mode_stats_hook, sender=model)
+        post_delete.connect(mode_stats_hook, sender=model)
+
+    for model in (Player, Team):
+        post_save.connect(leaderboard_hook, sender=model)
+        post_delete.connect(leaderboard_delete_hook, sender=model)
+
+    pre_save.connect(round_pre_save_hook, sender=Round)
+    post_save.connect(round_hook, sender=Round)
+    post_delete.connect(round_delete_hook, sender=Round)
 
 
 synced_models = {
@@ -58,3 +270,6 @@ def register_signals():
         print(f"Register signal for {model}")
         m2m_changed.connect(m2m_change_hook, sender=model)
 
+    register_stats_signals()
+    register_graphql_signals()
+
@@ -101,6 +101,67 @@ DATABASE_POOL_ARGS = {
     'recycle': 300,
 }
 
+# GraphQL
+# Number of distinct parsed and validated query documents kept in memory
+GRAPHQL_DOCUMENT_CACHE_SIZE = 256
+
+# Allow clients to send sha256 hash of a query they've sent before instead of its text
+GRAPHQL_PERSISTED_QUERIES = True
+
+# Queries estimated to cost more than this are rejected before execution
+GRAPHQL_MAX_QUERY_COST = 2000
+
+# Number of GraphQL responses kept in memory until data they were built from changes
+GRAPHQL_RESPONSE_CACHE_SIZE = 1024
+
+# Number of distinct changed rows kept for a GraphQL subscription between pushes,
+# subscription that falls further behind is simply pushed again
+GRAPHQL_SUBSCRIPTION_QUEUE_SIZE = 1000
+
+# Websocket
+# Number of outgoing events kept for a single connection that doesn't read them fast enough
+WS_SEND_QUEUE_SIZE = 256
+
+# What to do when send queue of a browser connection is full:
+# "drop_oldest" - forget queued events and tell client to load everything again,
+# "coalesce" - replace queued update of same model row, drop like above if there is none,
+# "disconnect" - close connection of slow client
+# Bukkit connections and events waiting for confirmation are never dropped
+WS_SEND_QUEUE_OVERFLOW = "coalesce"
+
+# Seconds to collect model changes for, every changed row is sent to clients once per this window
+WS_EVENT_DEBOUNCE = 0.05
+
+# Pub/sub that connects API workers, "memory://" for a single worker,
+# or any url supported by `broadcaster` package, like "redis://localhost:6379"
+WS_PUBSUB_URL = os.environ.get("WS_PUBSUB_URL", "memory://")
+
+# Number of recent model events kept to be replayed to clients that reconnect
+WS_REPLAY_BUFFER_SIZE = 4096
+
+# Bukkit server that is used when game has no server, or when no server is online
+BUKKIT_DEFAULT_SERVER = 1
+
+# Number of games a Bukkit server hosts at once, unless server tells otherwise
+BUKKIT_SERVER_CAPACITY = 10
+
+# Seconds between announcements of connected Bukkit servers to other workers.
+# Server that was not announced for 3 intervals is considered offline
+BUKKIT_SERVER_HEARTBEAT = 10
+
+# Seconds to wait for Bukkit to confirm a command
+BUKKIT_COMMAND_TIMEOUT = 5
+
+# Number of commands sent to a Bukkit server that can wait for confirmation at once
+BUKKIT_MAX_IN_FLIGHT = 16
+
+# Directory where commands for offline Bukkit servers are kept, None to keep them only in memory.
+# Each API worker keeps its journals in own subdirectory, journals of stopped workers are restored by new ones
+BUKKIT_JOURNAL_DIR = os.environ.get("BUKKIT_JOURNAL_DIR")
+
+# Seconds to wait for confirmation of an event that expects a response
+WS_RESPONSE_TIMEOUT = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -1,7 +1,6 @@
 import logging
 import os
 
-from broadcaster import Broadcast
 from django.core.wsgi import get_wsgi_application
 from fastapi_utils.tasks import repeat_every
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -17,18 +16,26 @@ from starlette.requests import HTTPConnection
 from fastapi import FastAPI
 
 from ariadne.asgi import GraphQL
-from ariadne.asgi.handlers import GraphQLWSHandler, GraphQLTransportWSHandler
+from ariadne.asgi.handlers import GraphQLTransportWSHandler
 
 from starlette.authentication import AuthenticationBackend
 from starlette.middleware.authentication import AuthenticationMiddleware
 from starlette.websockets import WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 
-from api.consumers import WsConn
+from api.consumers import WsConn, WsPool
+from api.events.bus import EventBus
+from api.events.debounce import ModelEventDebouncer
+from api.services.servers import ServerRegistry
 
 from api.exceptions import install_exception_handlers
 
-from api.graphql.query import schema
+from api.graphql.query import schema, tableManager
+from api.graphql.handler import CachedGraphQLHTTPHandler, BudgetedGraphQLWSHandler
+from api.graphql.cost import QueryCostAnalyzer
+from api.graphql.cache import response_cache
+from api.graphql.subscription import on_connect
+from django.conf import settings
 
 app = FastAPI()
 
@@ -59,7 +66,8 @@ app.include_router(prefix="/api", router=get_v1_router())
 @app.get("/status")
 def status():
     return {
-        "success": True
+        "success": True,
+        "websocket": WsPool.get_queue_metrics(),
     }
 
 
@@ -103,14 +111,54 @@ app.add_middleware(
 )
 
 
-app.mount("/graphql", GraphQL(schema, debug=True))
+cost_analyzer = QueryCostAnalyzer(
+    schema,
+    tableManager.get_field_costs(),
+    settings.GRAPHQL_MAX_QUERY_COST,
+)
+
+app.mount("/graphql", GraphQL(
+    schema,
+    debug=True,
+    http_handler=CachedGraphQLHTTPHandler(
+        cache_size=settings.GRAPHQL_DOCUMENT_CACHE_SIZE,
+        persisted_queries=settings.GRAPHQL_PERSISTED_QUERIES,
+        cost_analyzer=cost_analyzer,
+        response_cache=response_cache,
+    ),
+    websocket_handler=BudgetedGraphQLWSHandler(on_connect=on_connect, cost_analyzer=cost_analyzer),
+))
 
 install_exception_handlers(app)
 
 from api.signals import register_signals
 
 register_signals()
-broadcast = Broadcast("memory://")
+
+
+@app.on_event("startup")
+async def start_event_bus():
+    await EventBus.start()
+
+    # learn about bukkit servers connected to workers that started earlier
+    await ServerRegistry.query()
+
+
+@app.on_event("startup")
+async def start_model_events():
+    ModelEventDebouncer.start()
+
+
+@app.on_event("shutdown")
+async def stop_event_bus():
+    await EventBus.stop()
+
+
+@app.on_event("startup")
+@repeat_every(seconds=settings.BUKKIT_SERVER_HEARTBEAT)
+async def announce_bukkit_servers():
+    """ Keep servers connected to this worker listed by other workers """
+    WsPool.announce_bukkit_servers()
 
 
 @app.websocket("/ws/connect")
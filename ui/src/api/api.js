@@ -144,12 +144,14 @@ class MsApi extends ApiBase {
     async login(username, password) {
         let response = await this.post("auth/login", {username, password});
         localStorage.session_id = response.session_key;
+        window.$socket.authorize();
         return new Player(response.player_id);
     }
 
     async register(username, password, verification_code) {
         let response = await this.post("auth/register", {username, password, verification_code});
         localStorage.session_id = response.session_key;
+        window.$socket.authorize();
         return new Player(response.player_id);
     }
 
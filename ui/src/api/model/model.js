@@ -110,6 +110,25 @@ export class ModelManager {
         this.models[modelName] = models_of_type;
         return models_of_type[id];
     }
+
+    remove(type /** Class */, id /** Int */) {
+        /** Forget model, next construction with same id creates a fresh one */
+        let modelName = type instanceof Function ? type.name : type;
+        let models_of_type = this.models[modelName.toLowerCase()] || {};
+
+        delete models_of_type[id];
+    }
+
+    reloadAll() {
+        /** Fetch every known model again, used when missed updates can't be replayed */
+        for (let models_of_type of Object.values(this.models)) {
+            for (let model of Object.values(models_of_type)) {
+                if (model && typeof model.load == 'function') {
+                    model.load();
+                }
+            }
+        }
+    }
 }
 
 const fieldNameMap = (field) => {
@@ -154,6 +173,7 @@ export default function GraphQlQuery(id, fieldIds, config) {
         let existingModel = window.$models.get(modelName, id);
 
         if (existingModel) {
+            existingModel.retain();
             return existingModel;
         }
     
@@ -177,32 +197,79 @@ export default function GraphQlQuery(id, fieldIds, config) {
     // }
     this.fieldIds = fieldIds;
 
-    if (isView) {
-        window.$socket.onEvent("ModelUpdateEvent", (data) => {
-            let modelName = data.payload.model_name;
-            let modelId = data.payload.model_pk;
-            
-            for (let idPiece of Object.keys(this.constructor.__virtualId || {})) {
+    // every construction (including ones returning existing model) takes a reference,
+    // release() gives it back. Last release unsubscribes and releases nested models.
+    this.refs = 1;
+    this.children = [];
 
-                if (idPiece != modelName + "_id") { 
-                    continue;
-                }
+    let subscriptionId;
 
-                if (this.objectId[idPiece] == modelId) {
-                    this.load();
-                    return;
-                }
+    const onUpdate = (data) => {
+        let modelName = data.payload.model_name;
+        let modelId = data.payload.model_pk;
+        
+        for (let idPiece of Object.keys(this.constructor.__virtualId || {})) {
+
+            if (idPiece != modelName + "_id") { 
+                continue;
             }
-        });
+
+            if (this.objectId[idPiece] == modelId) {
+                this.load();
+                return;
+            }
+        }
+    };
+
+    if (isView) {
+        window.$socket.onEvent("ModelUpdateEvent", onUpdate);
+        subscriptionId = window.$socket.subscribe({view_id: this.objectId});
+    } else {
+        subscriptionId = window.$socket.subscribe({model_name: modelName, model_pk: id});
     }
     
     let reactive;
+    let storeId;
 
     if (isView) {
         // since views are unique, ids are generated randomly
-        reactive = window.$models.makeReactive(this, (this.objectId.model || "") + "-" + ("" + Math.random()).slice(2));
+        storeId = (this.objectId.model || "") + "-" + ("" + Math.random()).slice(2);
     } else {
-        reactive = window.$models.makeReactive(this, id);
+        storeId = id;
+    }
+    reactive = window.$models.makeReactive(this, storeId);
+
+    this.retain = () => {
+        this.refs += 1;
+        window.$socket.subscribe(JSON.parse(subscriptionId));
+    }
+
+    this.release = () => {
+        if (this.refs <= 0) {
+            return;
+        }
+        this.refs -= 1;
+        window.$socket.unsubscribe(subscriptionId);
+
+        if (this.refs > 0) {
+            return;
+        }
+
+        if (isView) {
+            window.$socket.offEvent("ModelUpdateEvent", onUpdate);
+        }
+        window.$models.remove(modelName, storeId);
+
+        for (let child of this.children) {
+            child.release();
+        }
+        this.children = [];
+    }
+
+    const newChild = (type, value) => {
+        let model = newModelInstance(type, value, this);
+        this.children.push(model);
+        return model;
     }
 
     this.getModelName = function() {
@@ -216,6 +283,11 @@ export default function GraphQlQuery(id, fieldIds, config) {
         }
 
         let fieldData = this.constructor.getGraphqlFields(isView);
+
+        // new children are created before old ones are released,
+        // so models present in both loads keep their subscription
+        let previousChildren = this.children;
+        this.children = [];
         
         for (let fieldName of Object.keys(fieldData)) {
 
@@ -237,7 +309,7 @@ export default function GraphQlQuery(id, fieldIds, config) {
                     continue;
                 }
 
-                reactive[fieldName] = newModelInstance(field.type, value, this);
+                reactive[fieldName] = newChild(field.type, value);
             }
             
             // only paginated model will be loading lists
@@ -256,8 +328,7 @@ export default function GraphQlQuery(id, fieldIds, config) {
                 while (reactive[fieldName].length) {
                     reactive[fieldName].pop();
                 }
-                const this_ = this;
-                reactive[fieldName].push(...value.map(x => newModelInstance(field.type, x, this_)));
+                reactive[fieldName].push(...value.map(x => newChild(field.type, x)));
             }
 
             else {
@@ -266,6 +337,10 @@ export default function GraphQlQuery(id, fieldIds, config) {
                 reactive[fieldName] = value;
             }
         }
+
+        for (let model of previousChildren) {
+            model.release();
+        }
     }
 
     this.load = async () => {
@@ -279,6 +354,7 @@ export default function GraphQlQuery(id, fieldIds, config) {
             if (field.type.__isPage) {
                 if (!reactive[fieldName]) {
                     reactive[fieldName] = new field.type(this);
+                    this.children.push(reactive[fieldName]);
                 }
             } else if (field.isArray) {
                 reactive[fieldName] = [];
@@ -633,12 +709,27 @@ GraphQlQuery.all = function () {
                 super(x);
                 this.items = [];
 
-                window.$socket.onEvent("ModelCreateEvent", (data) => {
+                const subscriptionId = window.$socket.subscribe({model_name: model.getModelName()});
+                const onCreate = (data) => {
                   let modelName = data.payload.model_name;
                   if (modelName.toLowerCase() == model.getModelName().toLowerCase()) {
                     this.load();
                   }
-                });
+                };
+                window.$socket.onEvent("ModelCreateEvent", onCreate);
+
+                const release = this.release;
+                let released = false;
+
+                this.release = () => {
+                    release();
+
+                    if (this.refs == 0 && !released) {
+                        released = true;
+                        window.$socket.unsubscribe(subscriptionId);
+                        window.$socket.offEvent("ModelCreateEvent", onCreate);
+                    }
+                }
             }
 
             [Symbol.iterator]() {
@@ -35,6 +35,12 @@ export class SocketConnection {
         this.handlersByEvtType = {};
         this.connected = false;
         this.queue = [];
+        this.subscriptions = {};
+        this.subscriptionRefs = {};
+
+        // position in server's event stream, to get missed events after reconnect
+        this.stream = null;
+        this.seq = null;
         this.try_connect();
     }
 
@@ -43,6 +49,10 @@ export class SocketConnection {
         this.handlersByEvtType[event].push(handler);
     }
 
+    offEvent(event, handler) {
+        (this.handlersByEvtType[event] || []).remove(h => h === handler);
+    }
+
     send(packetType, data) {
         let packet = {
             type: packetType,
@@ -70,6 +80,20 @@ export class SocketConnection {
                 _this.sock.send(JSON.stringify(packet));
             });
             _this.queue = [];
+
+            // server forgets subscriptions of closed socket
+            _this.authorize();
+
+            let topics = Object.values(_this.subscriptions);
+
+            if (_this.stream) {
+                // subscriptions go along, so events are not received both live and from replay
+                _this.sendEvent("ResumeEvent", {stream: _this.stream, seq: _this.seq, subscriptions: topics});
+            } else {
+                topics.forEach(topic => {
+                    _this.sendEvent("SubscribeEvent", topic);
+                });
+            }
         }
 
         this.sock.onclose = () => {
@@ -86,6 +110,18 @@ export class SocketConnection {
 
         this.sock.onmessage = (e) => {
             let data = JSON.parse(e.data);
+
+            if (data.seq != null) {
+                // already received, live or from replay
+                if (data.stream == _this.stream && data.seq <= _this.seq) {
+                    return;
+                }
+                _this.stream = data.stream;
+                _this.seq = data.seq;
+            } else if (data.type == "ResyncEvent") {
+                _this.stream = data.payload.stream;
+                _this.seq = data.payload.seq;
+            }
             let received_message = new WsEvent(data);
             console.log("received message", received_message);
             for (let handler of this.handlersByEvtType[received_message.type] || []) {
@@ -94,8 +130,49 @@ export class SocketConnection {
         }
     }
 
+    sendEvent(name, payload) {
+        if (this.connected && this.sock) {
+            this.sock.send(JSON.stringify({name, payload}));
+        }
+    }
+
+    /** Tell server who is on the other side of socket */
+    authorize() {
+        if (localStorage.session_id) {
+            this.sendEvent("AuthorizeEvent", {session_id: localStorage.session_id});
+        }
+    }
+
+    /**
+     * Receive model events of a row ({model_name, model_pk}), whole model ({model_name}) or view ({view_id}).
+     * Every subscribe has to be matched by unsubscribe, server is told once nobody needs the topic.
+     */
+    subscribe(topic) {
+        let subscription_id = JSON.stringify(topic);
+
+        this.subscriptionRefs[subscription_id] = (this.subscriptionRefs[subscription_id] || 0) + 1;
+
+        if (!this.subscriptions[subscription_id]) {
+            this.subscriptions[subscription_id] = topic;
+            this.sendEvent("SubscribeEvent", topic);
+        }
+        return subscription_id;
+    }
+
     async unsubscribe(subscription_id) {
-        /** TODO */
+        let topic = this.subscriptions[subscription_id];
+
+        if (!topic) {
+            return subscription_id;
+        }
+
+        this.subscriptionRefs[subscription_id] -= 1;
+
+        if (this.subscriptionRefs[subscription_id] <= 0) {
+            delete this.subscriptionRefs[subscription_id];
+            delete this.subscriptions[subscription_id];
+            this.sendEvent("UnsubscribeEvent", topic);
+        }
         return subscription_id;
     }
 }
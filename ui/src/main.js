@@ -31,10 +31,32 @@ const reactiveModels = {
         console.log("Model not found", modelName, modelId);
         return;
       }
+
+      // server sent new values of changed fields, no need to fetch whole model
+      if (data.payload.fields) {
+        Object.assign(model, data.payload.fields);
+        return;
+      }
   
       model.load();
     });
     
+    // updates that were missed while offline are gone, load everything again
+    window.$socket.onEvent("ResyncEvent", () => {
+      window.$models.reloadAll();
+    });
+
+    // models held by component leave the screen with it, stop receiving their events
+    Vue.mixin({
+      unmounted() {
+        for (let value of Object.values(this.$data || {})) {
+          if (value && typeof value.release == 'function') {
+            value.release();
+          }
+        }
+      }
+    });
+
     // window.$socket.onEvent("ModelCreateEvent", (data) => {
     //   let modelName = data.payload.model_name;
     //   let modelId = data.payload.model_pk;